@@ -0,0 +1,69 @@
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from bench_suite import generate_image, peak_rss_kb
+from crisiscore_processor import ImageProcessor
+
+def measure(args: tuple) -> dict:
+    # Runs in a fresh process so the peak reflects this one resize only
+    path, tier, width, height = args
+    processor = ImageProcessor(history_file=None)
+    start = time.perf_counter()
+    output = processor._execute(path, 'resize', {'width': width, 'height': height, 'tier': tier})
+    elapsed = time.perf_counter() - start
+    os.remove(output)
+    return {'seconds': elapsed, 'peak_rss_kb': peak_rss_kb()}
+
+def run(sizes: list, formats: list, target: int, repeat: int) -> list:
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as workdir:
+        for width, height in sizes:
+            source = generate_image((width, height), 'RGB', 'photo')
+            for fmt in formats:
+                path = os.path.join(workdir, f"source_{width}x{height}.{fmt.lower()}")
+                source.save(path, format=fmt)
+                target_size = (target, max(1, target * height // width))
+                for tier in ImageProcessor.RESIZE_TIERS:
+                    runs = []
+                    for _ in range(repeat):
+                        with context.Pool(1, maxtasksperchild=1) as pool:
+                            runs.append(pool.apply(measure, ((path, tier) + target_size,)))
+                    results.append({
+                        'source': f"{width}x{height}",
+                        'format': fmt,
+                        'target': f"{target_size[0]}x{target_size[1]}",
+                        'tier': tier,
+                        'median_seconds': statistics.median(r['seconds'] for r in runs),
+                        'peak_rss_mb': max(r['peak_rss_kb'] for r in runs) / 1024,
+                    })
+    return results
+
+def parse_size(value: str) -> tuple:
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare resize tiers on large generated inputs')
+    parser.add_argument('--size', dest='sizes', action='append', type=parse_size,
+                        help='Source size WIDTHxHEIGHT, repeatable (default: 6000x4000)')
+    parser.add_argument('--format', dest='formats', action='append',
+                        help='Source format, repeatable (default: JPEG and PNG)')
+    parser.add_argument('--target', type=int, default=320, help='Target width in pixels')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', metavar='FILE', help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.sizes or [(6000, 4000)], args.formats or ['JPEG', 'PNG'], args.target, args.repeat)
+    print(f"{'Source':12} {'Format':6} {'Target':10} {'Tier':9} {'Time (s)':>9} {'Peak RSS (MB)':>14}")
+    for r in results:
+        print(f"{r['source']:12} {r['format']:6} {r['target']:10} {r['tier']:9} "
+              f"{r['median_seconds']:9.3f} {r['peak_rss_mb']:14.1f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,91 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from PIL import Image, ImageChops
+
+from bench_suite import generate_image, peak_rss_kb
+from crisiscore_processor import ImageProcessor
+
+MODES = ('affine', 'transpose', 'lossless')
+
+def measure(args: tuple) -> dict:
+    # Runs in a fresh process so the peak reflects this one rotation only
+    path, mode, angle = args
+    start = time.perf_counter()
+    if mode == 'affine':
+        # What a rotation costs without the right-angle fast path: passing the centre
+        # explicitly makes Pillow take the general resampling route
+        output = os.path.splitext(path)[0] + '_affine' + os.path.splitext(path)[1]
+        with Image.open(path) as img:
+            img.rotate(angle, expand=True, center=(img.width / 2, img.height / 2)).save(output)
+    else:
+        processor = ImageProcessor(history_file=None)
+        output = processor._execute(path, 'rotate', {'angle': angle, 'lossless': mode == 'lossless'})
+    elapsed = time.perf_counter() - start
+
+    # Distance from the ideal result: the decoded source, transposed exactly
+    with Image.open(path) as source, Image.open(output) as result:
+        ideal = source.transpose(ImageProcessor.TRANSPOSE_ROTATIONS[angle])
+        max_error = max(high for _, high in ImageChops.difference(ideal, result.convert(ideal.mode)).getextrema())
+    os.remove(output)
+    return {'seconds': elapsed, 'peak_rss_kb': peak_rss_kb(), 'max_error': max_error}
+
+def run(sizes: list, formats: list, angle: int, repeat: int) -> list:
+    results = []
+    modes = [m for m in MODES if m != 'lossless' or shutil.which('jpegtran')]
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as workdir:
+        for width, height in sizes:
+            source = generate_image((width, height), 'RGB', 'photo')
+            for fmt in formats:
+                path = os.path.join(workdir, f"source_{width}x{height}.{fmt.lower()}")
+                source.save(path, format=fmt)
+                for mode in modes:
+                    if mode == 'lossless' and fmt != 'JPEG':
+                        continue
+                    runs = []
+                    for _ in range(repeat):
+                        with context.Pool(1, maxtasksperchild=1) as pool:
+                            runs.append(pool.apply(measure, ((path, mode, angle),)))
+                    results.append({
+                        'source': f"{width}x{height}",
+                        'format': fmt,
+                        'mode': mode,
+                        'median_seconds': statistics.median(r['seconds'] for r in runs),
+                        'peak_rss_mb': max(r['peak_rss_kb'] for r in runs) / 1024,
+                        'max_error': max(r['max_error'] for r in runs),
+                    })
+    return results
+
+def parse_size(value: str) -> tuple:
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare affine, transpose and lossless JPEG right-angle rotation')
+    parser.add_argument('--size', dest='sizes', action='append', type=parse_size,
+                        help='Source size WIDTHxHEIGHT, repeatable (default: 4000x3008; multiples of 16 '
+                             'keep every JPEG MCU whole, so jpegtran -perfect succeeds)')
+    parser.add_argument('--format', dest='formats', action='append',
+                        help='Source format, repeatable (default: JPEG and PNG)')
+    parser.add_argument('--angle', type=int, default=90, choices=sorted(ImageProcessor.TRANSPOSE_ROTATIONS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', metavar='FILE', help='Also write the results as JSON')
+    args = parser.parse_args()
+
+    if not shutil.which('jpegtran'):
+        print("jpegtran not found: skipping the lossless mode")
+    results = run(args.sizes or [(4000, 3008)], args.formats or ['JPEG', 'PNG'], args.angle, args.repeat)
+    print(f"{'Source':12} {'Format':6} {'Mode':10} {'Time (s)':>9} {'Peak RSS (MB)':>14} {'Max error':>10}")
+    for r in results:
+        print(f"{r['source']:12} {r['format']:6} {r['mode']:10} "
+              f"{r['median_seconds']:9.3f} {r['peak_rss_mb']:14.1f} {r['max_error']:10}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,276 @@
+from PIL import Image, ImageDraw, ImageFilter
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+from crisiscore_processor import ImageProcessor
+
+SIZES = {
+    'thumb': (160, 120),
+    '1mp': (1280, 800),
+    '12mp': (4000, 3000),
+    '50mp': (8660, 5774),
+}
+MODES = ('RGB', 'RGBA', 'L', 'P')
+CONTENTS = ('noise', 'gradient', 'photo')
+FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'TIFF': '.tif'}
+DEFAULT_SIZES = ('thumb', '1mp')
+
+def generate_image(size: tuple, mode: str = 'RGB', content: str = 'photo', seed: int = 0) -> Image.Image:
+    # String seeds are hashed with SHA-512, so the corpus is identical on every machine and run
+    rng = random.Random(f"{seed}:{size[0]}x{size[1]}:{content}")
+    width, height = size
+
+    if content == 'noise':
+        img = Image.frombytes('RGB', size, rng.randbytes(width * height * 3))
+    else:
+        red = Image.linear_gradient('L').resize(size)
+        green = Image.radial_gradient('L').resize(size)
+        blue = Image.linear_gradient('L').transpose(Image.Transpose.ROTATE_90).resize(size)
+        img = Image.merge('RGB', (red, green, blue))
+
+    if content == 'photo':
+        # Low-frequency structure, hard-edged shapes and a little sensor grain
+        coarse = (max(1, width // 16), max(1, height // 16))
+        detail = Image.frombytes('RGB', coarse, rng.randbytes(coarse[0] * coarse[1] * 3))
+        img = Image.blend(img, detail.resize(size, Image.Resampling.BICUBIC), 0.4)
+        draw = ImageDraw.Draw(img)
+        for _ in range(24):
+            x, y = rng.randrange(width), rng.randrange(height)
+            radius = rng.randrange(1, max(2, min(width, height) // 4))
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        img = img.filter(ImageFilter.GaussianBlur(1))
+        grain = Image.frombytes('L', size, rng.randbytes(width * height)).convert('RGB')
+        img = Image.blend(img, grain, 0.06)
+
+    if mode == 'RGBA':
+        img.putalpha(Image.linear_gradient('L').transpose(Image.Transpose.ROTATE_270).resize(size))
+    elif mode == 'L':
+        img = img.convert('L')
+    elif mode == 'P':
+        img = img.convert('P')
+    return img
+
+def build_corpus(directory: str, sizes: list, modes: list, contents: list, formats: list) -> tuple[list, list]:
+    sources, skipped = [], []
+    os.makedirs(directory, exist_ok=True)
+    for size_name in sizes:
+        for mode in modes:
+            for content in contents:
+                img = None
+                for fmt in formats:
+                    source_id = f"{size_name}/{mode}/{content}/{fmt}"
+                    path = os.path.join(directory, f"{size_name}_{mode}_{content}{FORMATS[fmt]}")
+                    if not os.path.exists(path):
+                        img = img or generate_image(SIZES[size_name], mode, content)
+                        try:
+                            img.save(path, format=fmt)
+                        except Exception as e:
+                            if os.path.exists(path):
+                                os.remove(path)
+                            skipped.append({'source': source_id, 'reason': f"{type(e).__name__}: {e}"})
+                            continue
+                    sources.append({'source': source_id, 'path': path, 'size': size_name,
+                                    'mode': mode, 'content': content, 'format': fmt})
+    return sources, skipped
+
+def operation_cases(size: tuple, formats: list) -> list:
+    width, height = size
+    cases = [(f"convert-{fmt.lower()}", 'convert', {'format': fmt}) for fmt in formats]
+    cases += [
+        ('resize-half', 'resize', {'width': max(1, width // 2), 'height': max(1, height // 2)}),
+        ('rotate-90', 'rotate', {'angle': 90}),
+        ('rotate-30', 'rotate', {'angle': 30}),
+        ('flip-horizontal', 'flip', {'direction': 'horizontal'}),
+        ('orient', 'orient', {}),
+    ]
+    cases += [(f"enhance-{kind}", 'enhance', {'enhancement_type': kind, 'factor': 1.3})
+              for kind in ('brightness', 'contrast', 'gamma', 'sharpness', 'color')]
+    cases += [
+        ('enhance-levels', 'enhance', {'enhancement_type': 'levels', 'black': 16, 'white': 235}),
+        ('enhance-stack', 'pipeline', {'steps': [
+            {'operation': 'enhance', 'enhancement_type': kind, 'factor': 1.2}
+            for kind in ('brightness', 'contrast', 'gamma')]}),
+        # One decode, three widths that cascade from each other, two encoders per width
+        ('renditions', 'renditions', {'widths': [max(1, width // d) for d in (2, 4, 8)],
+                                      'formats': ['JPEG', 'WEBP']}),
+    ]
+    return cases
+
+def remove_output(output: str):
+    # A renditions run returns its manifest; the files it lists sit beside it
+    if output.endswith('_renditions.json'):
+        with open(output) as f:
+            for rendition in json.load(f)['renditions']:
+                os.remove(os.path.join(os.path.dirname(output), rendition['path']))
+    os.remove(output)
+
+def peak_rss_kb() -> int:
+    # VmHWM belongs to the current address space; ru_maxrss survives exec and would
+    # report the parent's peak in a freshly spawned worker
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure(args: tuple) -> dict:
+    # Runs in a fresh process: one warm-up, then timed iterations, then the process peak
+    path, operation, params, repeat = args
+    processor = ImageProcessor(history_file=None)
+    latencies = []
+    try:
+        for iteration in range(repeat + 1):
+            start = time.perf_counter()
+            output = processor._execute(path, operation, params)
+            elapsed = time.perf_counter() - start
+            remove_output(output)
+            if iteration:
+                latencies.append(elapsed)
+    except Exception as e:
+        return {'latencies': latencies, 'peak_rss_kb': peak_rss_kb(), 'error': f"{type(e).__name__}: {e}"}
+    return {'latencies': latencies, 'peak_rss_kb': peak_rss_kb(), 'error': None}
+
+def measure_isolated(args: tuple) -> dict:
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(measure, (args,))
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+def run_suite(sources: list, formats: list, operations: list, repeat: int) -> list:
+    results = []
+    for source in sources:
+        size = SIZES[source['size']]
+        for label, operation, params in operation_cases(size, formats):
+            if operations and label not in operations and operation not in operations:
+                continue
+            measured = measure_isolated((source['path'], operation, params, repeat))
+            result = dict({k: v for k, v in source.items() if k != 'path'},
+                          case=f"{source['source']}/{label}", operation=label,
+                          iterations=len(measured['latencies']), error=measured['error'],
+                          peak_rss_mb=measured['peak_rss_kb'] / 1024)
+            if measured['latencies']:
+                mean = sum(measured['latencies']) / len(measured['latencies'])
+                result.update({
+                    'p50_ms': percentile(measured['latencies'], 0.50) * 1000,
+                    'p95_ms': percentile(measured['latencies'], 0.95) * 1000,
+                    'mean_ms': mean * 1000,
+                    'images_per_sec': 1 / mean,
+                    'megapixels_per_sec': size[0] * size[1] / 1e6 / mean,
+                })
+            results.append(result)
+            status = result['error'] or f"p50 {result['p50_ms']:.2f}ms  p95 {result['p95_ms']:.2f}ms"
+            print(f"{result['case']:45} {status}  rss {result['peak_rss_mb']:.1f}MB", flush=True)
+    return results
+
+def selected_cases(sizes: list, modes: list, contents: list, formats: list, operations: list) -> set:
+    # Every case these arguments ask for, whether or not its source could be generated
+    cases = set()
+    for size_name in sizes:
+        for label, operation, _ in operation_cases(SIZES[size_name], formats):
+            if operations and label not in operations and operation not in operations:
+                continue
+            cases.update(f"{size_name}/{mode}/{content}/{fmt}/{label}"
+                         for mode in modes for content in contents for fmt in formats)
+    return cases
+
+def compare(results: list, baseline: dict, threshold: float, selected: Optional[set] = None) -> list:
+    previous = {r['case']: r for r in baseline.get('results', [])}
+    current = {r['case'] for r in results}
+    regressions = []
+    # A case that worked before and now fails or is gone is the worst regression, not a skip
+    for case, base in previous.items():
+        if case not in current and not base.get('error') and (selected is None or case in selected):
+            regressions.append({'case': case, 'metric': 'missing', 'baseline': None, 'current': None,
+                                'change': None})
+    for result in results:
+        base = previous.get(result['case'])
+        if not base or base.get('error'):
+            continue
+        if result.get('error'):
+            regressions.append({'case': result['case'], 'metric': 'error', 'baseline': None,
+                                'current': result['error'], 'change': None})
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'peak_rss_mb'):
+            if base.get(metric) and result[metric] > base[metric] * (1 + threshold):
+                regressions.append({'case': result['case'], 'metric': metric, 'baseline': base[metric],
+                                    'current': result[metric], 'change': result[metric] / base[metric] - 1})
+    return regressions
+
+def metadata(args: argparse.Namespace) -> dict:
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'pillow': Image.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+    }
+
+def split_list(value: str) -> list:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every ImageProcessor operation on a synthetic corpus')
+    parser.add_argument('--sizes', type=split_list, default=list(DEFAULT_SIZES),
+                        help=f"Comma-separated from {', '.join(SIZES)} (default: {','.join(DEFAULT_SIZES)})")
+    parser.add_argument('--modes', type=split_list, default=list(MODES))
+    parser.add_argument('--contents', type=split_list, default=list(CONTENTS))
+    parser.add_argument('--formats', type=split_list, default=list(FORMATS))
+    parser.add_argument('--operations', type=split_list, default=[],
+                        help='Only these operations or case labels (e.g. resize,enhance-contrast)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed iterations per case (after one warm-up)')
+    parser.add_argument('--corpus', metavar='DIR', help='Keep the generated corpus here and reuse it')
+    parser.add_argument('--output', metavar='FILE', default='bench_results.json')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against a previous results file')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown or memory growth counted as a regression (default: 0.10)')
+    args = parser.parse_args()
+
+    for name, values, allowed in (('size', args.sizes, SIZES), ('mode', args.modes, MODES),
+                                  ('content', args.contents, CONTENTS), ('format', args.formats, FORMATS)):
+        unknown = [v for v in values if v not in allowed]
+        if unknown:
+            parser.error(f"Unknown {name}: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus = args.corpus or workdir
+        sources, skipped = build_corpus(corpus, args.sizes, args.modes, args.contents, args.formats)
+        results = run_suite(sources, args.formats, args.operations, args.repeat)
+
+    report = {'meta': metadata(args), 'skipped': skipped, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n{len(results)} cases written to {args.output} ({len(skipped)} source combinations skipped)")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            selected = selected_cases(args.sizes, args.modes, args.contents, args.formats, args.operations)
+            regressions = compare(results, json.load(f), args.threshold, selected)
+        for r in regressions:
+            if r['metric'] == 'missing':
+                print(f"REGRESSION {r['case']}: in the baseline but not run")
+            elif r['metric'] == 'error':
+                print(f"REGRESSION {r['case']}: now fails with {r['current']}")
+            else:
+                print(f"REGRESSION {r['case']} {r['metric']}: {r['baseline']:.2f} -> {r['current']:.2f} "
+                      f"({r['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
@@ -1,14 +1,39 @@
 import os
 import sys
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageEnhance, ImageFilter, ImageChops
 from datetime import datetime
 import json
 from colorama import init, Fore, Style
 from tqdm import tqdm
 import logging
 import shutil
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Iterator, Callable, Set, Union
 import time
+import argparse
+import glob
+import math
+import hashlib
+import sqlite3
+import atexit
+import fnmatch
+import bisect
+import re
+import cProfile
+import pstats
+import tracemalloc
+import multiprocessing.util
+from contextlib import contextmanager
+import struct
+import zlib
+import subprocess
+import io
+import tempfile
+import threading
+import mmap
+from collections import deque
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
 # Initialize colorama for cross-platform color support
 init()
@@ -30,95 +55,2353 @@ class CCTheme:
     @staticmethod
     def accent(text): return f"{CCTheme.ACCENT}{text}{CCTheme.RESET}"
 
+class StageTimer:
+    STAGES = ('open', 'decode', 'transform', 'encode', 'history')
+
+    def __init__(self, on_stage: Optional[Callable[[str], None]] = None):
+        self.stages: Dict[str, float] = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.peak_image_bytes = 0
+        self.on_stage = on_stage
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            if self.on_stage:
+                self.on_stage(name)
+
+    def track_image(self, img: Image.Image):
+        self.peak_image_bytes = max(self.peak_image_bytes, img.width * img.height * len(img.getbands()))
+
+    def as_dict(self) -> Dict:
+        return {
+            'stages': dict(self.stages),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'peak_image_bytes': self.peak_image_bytes,
+        }
+
+    def summary(self) -> str:
+        return ' | '.join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.stages.items())
+
+class ProfileHook:
+    # Installed in each batch worker; multiprocessing runs Finalize callbacks when the worker exits
+    def __init__(self, profile_path: Optional[str] = None, tracemalloc_path: Optional[str] = None,
+                 top: int = 25):
+        self.profile_path = profile_path
+        self.tracemalloc_path = tracemalloc_path
+        self.top = top
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def install(self):
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if self.tracemalloc_path:
+            tracemalloc.start()
+        multiprocessing.util.Finalize(None, self.finish, exitpriority=100)
+
+    def finish(self):
+        if self._profiler:
+            self._profiler.disable()
+            self._profiler.dump_stats(f"{self.profile_path}.{os.getpid()}")
+            self._profiler = None
+        if self.tracemalloc_path and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            lines = [f"# worker {os.getpid()}: peak traced {FileExplorer.format_size(peak)}"]
+            lines += [str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:self.top]]
+            tracemalloc.stop()
+            with open(self.tracemalloc_path, 'a') as f:
+                f.write('\n'.join(lines) + '\n\n')
+
+    def merge(self):
+        # Combine the per-worker cProfile dumps into a single stats file
+        if not self.profile_path:
+            return
+        parts = glob.glob(glob.escape(self.profile_path) + '.*')
+        if not parts:
+            return
+        pstats.Stats(*parts).dump_stats(self.profile_path)
+        for part in parts:
+            os.remove(part)
+
+class ResultCache:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, blob TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL, digest TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS outputs (
+            key TEXT NOT NULL, input TEXT NOT NULL, path TEXT NOT NULL, PRIMARY KEY (key, input));
+    '''
+
+    def __init__(self, cache_dir: str = '.cc_cache', max_bytes: int = 1024 ** 3):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # SQLite connections must not cross fork(); each worker process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'),
+                                         timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(self.SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def content_digest(self, path: str) -> str:
+        path = os.path.realpath(path)
+        stats = os.stat(path)
+        row = self.connection.execute(
+            'SELECT digest FROM fingerprints WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+            (path, stats.st_size, stats.st_mtime_ns, stats.st_ino)).fetchone()
+        if row:
+            return row[0]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)',
+            (path, stats.st_size, stats.st_mtime_ns, stats.st_ino, digest.hexdigest()))
+        return digest.hexdigest()
+
+    def make_key(self, input_path: str, operation: str, params: Dict) -> str:
+        # The input extension decides the output encoder, so it is part of the key
+        canonical = json.dumps({
+            'content': self.content_digest(input_path),
+            'extension': os.path.splitext(input_path)[1].lower(),
+            'operation': operation,
+            'parameters': params,
+        }, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        row = self.connection.execute('SELECT blob FROM entries WHERE key = ?', (key,)).fetchone()
+        if row:
+            temp_path = f"{output_path}.{os.getpid()}.tmp"
+            try:
+                # Linked beside the destination first: the destination may already exist as a reserved name
+                self._link(os.path.join(self.cache_dir, row[0]), temp_path)
+                os.replace(temp_path, output_path)
+                self.connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+                self._count('hits')
+                return True
+            except FileNotFoundError:
+                # Evicted by another process between the lookup and the link
+                self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self._count('misses')
+        return False
+
+    def previous_output(self, key: str, input_path: str) -> Optional[str]:
+        # The file an earlier run wrote for this input, if it is still the cached result: a repeat
+        # hands that back instead of linking the same bytes under yet another timestamped name
+        row = self.connection.execute(
+            'SELECT outputs.path, entries.blob FROM outputs JOIN entries ON entries.key = outputs.key '
+            'WHERE outputs.key = ? AND outputs.input = ?', (key, os.path.realpath(input_path))).fetchone()
+        if not row:
+            return None
+        try:
+            output, blob = os.stat(row[0]), os.stat(os.path.join(self.cache_dir, row[1]))
+        except FileNotFoundError:
+            return None
+        # Hardlinked, or copied with its mtime when the cache is on another filesystem
+        if ((output.st_dev, output.st_ino) != (blob.st_dev, blob.st_ino)
+                and (output.st_size, output.st_mtime_ns) != (blob.st_size, blob.st_mtime_ns)):
+            return None
+        self.connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+        self._count('hits')
+        return row[0]
+
+    def remember(self, key: str, input_path: str, output_path: str):
+        self.connection.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?)',
+                                (key, os.path.realpath(input_path), os.path.abspath(output_path)))
+
+    def store(self, key: str, output_path: str):
+        blob = key + os.path.splitext(output_path)[1].lower()
+        blob_path = os.path.join(self.cache_dir, blob)
+        temp_path = f"{blob_path}.{os.getpid()}.tmp"
+        try:
+            self._link(output_path, temp_path)
+            os.replace(temp_path, blob_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                                (key, blob, os.path.getsize(blob_path), time.time()))
+        self.evict()
+
+    def evict(self):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            evicted = []
+            if total > self.max_bytes:
+                for key, blob, size in connection.execute(
+                        'SELECT key, blob, size FROM entries ORDER BY last_access'):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((key, blob))
+                    total -= size
+                connection.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key, _ in evicted])
+                connection.executemany('DELETE FROM outputs WHERE key = ?', [(key,) for key, _ in evicted])
+                if evicted:
+                    self._count('evictions', len(evicted))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        for _, blob in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, blob))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        counters = dict(self.connection.execute('SELECT name, value FROM counters'))
+        entries, total = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+            'entries': entries,
+            'bytes': total,
+        }
+
+    def _count(self, name: str, amount: int = 1):
+        self.connection.execute(
+            'INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            (name, amount))
+
+    @staticmethod
+    def _link(source: str, destination: str):
+        try:
+            os.link(source, destination)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # Different filesystem or no hardlink support
+            shutil.copy2(source, destination)
+
+class HistoryStore:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, operation TEXT NOT NULL,
+            input TEXT, output TEXT, parameters TEXT);
+        CREATE INDEX IF NOT EXISTS history_input ON history (input, timestamp);
+        CREATE INDEX IF NOT EXISTS history_operation ON history (operation, timestamp);
+        CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+    '''
+
+    def __init__(self, path: str = 'cc_history.sqlite', batch_size: int = 64, flush_interval: float = 1.0,
+                 max_entries: Optional[int] = None, max_age_days: Optional[float] = None,
+                 compact_every: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.compact_every = compact_every
+        self._pending: List[Dict] = []
+        self._last_flush = time.monotonic()
+        self._since_compact = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid = None
+        atexit.register(self.close)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(self.SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+            self._pending = []
+        return self._connection
+
+    def import_legacy(self, json_path: str):
+        # One-time migration of the old whole-file history
+        if not os.path.exists(json_path) or len(self):
+            return
+        with open(json_path, 'r') as f:
+            for record in json.load(f):
+                self.append(record)
+        self.flush()
+
+    def append(self, record: Dict):
+        # Group commit: records are buffered and written in one transaction per batch
+        self._pending.append(record)
+        if (len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        rows = [(r.get('timestamp') or datetime.now().isoformat(), r.get('operation'), r.get('input'),
+                 r.get('output'), json.dumps(r.get('parameters', {}), default=str)) for r in self._pending]
+        connection = self.connection
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO history (timestamp, operation, input, output, parameters) VALUES (?, ?, ?, ?, ?)', rows)
+        connection.execute('COMMIT')
+        self._pending = []
+        self._since_compact += len(rows)
+        if self._since_compact >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        self._since_compact = 0
+        connection = self.connection
+        if self.max_age_days is not None:
+            cutoff = datetime.fromtimestamp(time.time() - self.max_age_days * 86400).isoformat()
+            connection.execute('DELETE FROM history WHERE timestamp < ?', (cutoff,))
+        if self.max_entries is not None:
+            connection.execute(
+                'DELETE FROM history WHERE id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                (self.max_entries,))
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def query(self, input_path: Optional[str] = None, operation: Optional[str] = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None,
+              limit: Optional[int] = 100) -> List[Dict]:
+        self.flush()
+        clauses, args = [], []
+        if input_path is not None:
+            clauses.append('input = ?')
+            args.append(input_path)
+        if operation is not None:
+            clauses.append('operation = ?')
+            args.append(operation)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            args.append(since.isoformat() if isinstance(since, datetime) else since)
+        if until is not None:
+            clauses.append('timestamp < ?')
+            args.append(until.isoformat() if isinstance(until, datetime) else until)
+        sql = 'SELECT timestamp, operation, input, output, parameters FROM history'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(limit)
+        return [{'timestamp': timestamp, 'operation': op, 'input': input_, 'output': output,
+                 'parameters': json.loads(parameters) if parameters else {}}
+                for timestamp, op, input_, output, parameters in self.connection.execute(sql, args)]
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        return self.query(limit=limit)
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM history').fetchone()[0] + len(self._pending)
+
+    def close(self):
+        if self._connection is None or self._pid != os.getpid():
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"History flush failed: {e}")
+        self._connection.close()
+        self._connection = None
+
+# Image.MAX_IMAGE_PIXELS is module state; it is only ever lifted for one open at a time
+_pixel_limit_lock = threading.Lock()
+
 class ImageProcessor:
-    def __init__(self):
-        self.supported_formats = {'.jpg', '.jpeg', '.png', '.webp'}
-        self.history = []
+    STEP_OPERATIONS = ('convert', 'resize', 'rotate', 'flip', 'orient', 'enhance')
+    OPERATIONS = STEP_OPERATIONS + ('pipeline', 'renditions')
+
+    TRANSPOSE_ROTATIONS = {
+        90: Image.Transpose.ROTATE_90,
+        180: Image.Transpose.ROTATE_180,
+        270: Image.Transpose.ROTATE_270,
+    }
+    # Every lossless transpose as (mirrored left-right first, then rotated counter-clockwise by angle)
+    TRANSPOSES = {
+        (False, 90): Image.Transpose.ROTATE_90,
+        (False, 180): Image.Transpose.ROTATE_180,
+        (False, 270): Image.Transpose.ROTATE_270,
+        (True, 0): Image.Transpose.FLIP_LEFT_RIGHT,
+        (True, 90): Image.Transpose.TRANSPOSE,
+        (True, 180): Image.Transpose.FLIP_TOP_BOTTOM,
+        (True, 270): Image.Transpose.TRANSVERSE,
+    }
+    FLIPS = {'horizontal': (True, 0), 'vertical': (True, 180)}
+    # EXIF orientation value -> transpose that makes the pixels upright
+    EXIF_ORIENTATION = 0x0112
+    ORIENTATIONS = {2: (True, 0), 3: (False, 180), 4: (True, 180), 5: (True, 90),
+                    6: (False, 270), 7: (True, 270), 8: (False, 90)}
+    # getexif() on a TIFF is its whole first IFD. These tags describe the input's pixel layout (size,
+    # samples, strips, tiles); saved back, they'd override what the encoder writes for the output
+    TIFF_LAYOUT_TAGS = frozenset([254, 255, 256, 257, 258, 259, 262, 263, 266, 273, 277, 278, 279, 280, 281, 284,
+                                  317, 320, 322, 323, 324, 325, 330, 338, 339, 340, 341, 347, 530])
+    # jpegtran rotates clockwise
+    JPEGTRAN_TRANSFORMS = {
+        (False, 90): ['-rotate', '270'],
+        (False, 180): ['-rotate', '180'],
+        (False, 270): ['-rotate', '90'],
+        (True, 0): ['-flip', 'horizontal'],
+        (True, 90): ['-transpose'],
+        (True, 180): ['-flip', 'vertical'],
+        (True, 270): ['-transverse'],
+    }
+
+    # Resize tiers trading quality for speed: (draft oversampling, reducing_gap, resample).
+    # 'full' keeps the native-resolution decode and Pillow's default filter; only past the tile
+    # budget does it draft-decode, and then never below twice the target size.
+    RESIZE_TIERS = {
+        'full': None,
+        'balanced': (2, 3.0, Image.Resampling.BICUBIC),
+        'fast': (1, 1.5, Image.Resampling.BILINEAR),
+    }
+
+    # Stems _generate_output_path and renditions give their outputs. They land next to the inputs,
+    # so source walks skip them; otherwise each re-run would process the last run's results again
+    OUTPUT_STEM = re.compile(r'_(?:%s)_\d{8}_\d{6}(?:_\d+)?$|_(?:jpg|jpeg|png|webp|tif|tiff)_\d+w$'
+                             % '|'.join(OPERATIONS))
+
+    # The old JSON history kept 100 entries; the store keeps far more, but not without bound
+    HISTORY_MAX_ENTRIES = 100000
+
+    RENDITION_FORMATS = {'JPEG': '.jpg', 'WEBP': '.webp', 'PNG': '.png'}
+    # A rendition is resampled from the smallest earlier one at least this much larger;
+    # cascading across smaller steps stacks up blur
+    RENDITION_CASCADE_RATIO = 2.0
+
+    def __init__(self, history_file: Optional[str] = 'cc_history.sqlite', cache: Optional[ResultCache] = None,
+                 tile_budget: Optional[int] = None, history_max_entries: Optional[int] = HISTORY_MAX_ENTRIES,
+                 history_max_age_days: Optional[float] = None, allow_large_images: bool = False):
+        self.supported_formats = {'.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff'}
+        self.history_file = history_file
+        self.history_max_entries = history_max_entries
+        self.history_max_age_days = history_max_age_days
+        self.cache = cache
+        # Decoded frames larger than this many bytes are processed in strips where the plan allows
+        self.tile_budget = tile_budget
+        # Past Pillow's pixel limit only when the tiled path keeps the job inside tile_budget
+        self.allow_large_images = allow_large_images
+        self.history: Optional[HistoryStore] = None
         self.load_history()
 
     def load_history(self):
+        if not self.history_file:
+            return
         try:
-            if os.path.exists('cc_history.json'):
-                with open('cc_history.json', 'r') as f:
-                    self.history = json.load(f)
+            # A small cap is enforced as it fills rather than overshooting by a whole compaction period
+            compact_every = min(10000, self.history_max_entries or 10000)
+            self.history = HistoryStore(self.history_file, max_entries=self.history_max_entries,
+                                        max_age_days=self.history_max_age_days, compact_every=compact_every)
+            self.history.import_legacy('cc_history.json')
+            if self.history_max_entries is not None or self.history_max_age_days is not None:
+                # Apply retention on open too; otherwise it only runs after compact_every new records
+                self.history.compact()
         except Exception as e:
             logging.error(f"History load failed: {e}")
-            self.history = []
+            self.history = None
 
     def save_history(self):
+        if self.history is None:
+            return
         try:
-            with open('cc_history.json', 'w') as f:
-                json.dump(self.history[-100:], f)  # Keep last 100 operations
+            self.history.flush()
         except Exception as e:
             logging.error(f"History save failed: {e}")
 
-    def process_image(self, input_path: str, operation: str, **kwargs) -> Optional[str]:
+    def process_image(self, input_path: str, operation: str, timer: Optional[StageTimer] = None,
+                      **kwargs) -> Optional[str]:
+        timer = timer or StageTimer()
         try:
-            with Image.open(input_path) as img:
-                output_path = self._generate_output_path(input_path, operation)
-                
-                if operation == 'convert':
-                    img.save(output_path, format=kwargs['format'])
-                elif operation == 'resize':
-                    resized = img.resize((kwargs['width'], kwargs['height']))
-                    resized.save(output_path)
-                elif operation == 'rotate':
-                    rotated = img.rotate(kwargs['angle'], expand=True)
-                    rotated.save(output_path)
-                elif operation == 'enhance':
-                    enhanced = self._apply_enhancement(img, kwargs['enhancement_type'], kwargs['factor'])
-                    enhanced.save(output_path)
-                
+            output_path = self._execute(input_path, operation, kwargs, timer)
+            with timer.stage('history'):
                 self._record_operation(input_path, output_path, operation, kwargs)
-                return output_path
+            return output_path
         except Exception as e:
             logging.error(f"Processing error: {e}")
             return None
 
+    def process_pipeline(self, input_path: str, steps: List[Dict]) -> Optional[str]:
+        return self.process_image(input_path, 'pipeline', steps=steps)
+
+    def _execute(self, input_path: str, operation: str, kwargs: Dict, timer: Optional[StageTimer] = None) -> str:
+        # Raises on failure so batch workers can report the actual error per file
+        if operation not in self.OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        timer = timer or StageTimer()
+        timer.bytes_read = os.path.getsize(input_path)
+        if operation == 'renditions':
+            return self._execute_renditions(input_path, kwargs, timer)
+
+        cache_key = None
+        if self.cache:
+            with timer.stage('cache'):
+                cache_key = self.cache.make_key(input_path, operation, kwargs)
+                previous = self.cache.previous_output(cache_key, input_path)
+            if previous:
+                timer.bytes_written = os.path.getsize(previous)
+                return previous
+
+        output_path = self._generate_output_path(input_path, operation)
+        try:
+            self._render(input_path, operation, kwargs, output_path, timer, cache_key)
+        except BaseException:
+            # The name was reserved up front; don't leave an empty or partial file behind
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        if cache_key:
+            self.cache.remember(cache_key, input_path, output_path)
+        timer.bytes_written = os.path.getsize(output_path)
+        return output_path
+
+    def _render(self, input_path: str, operation: str, kwargs: Dict, output_path: str, timer: StageTimer,
+                cache_key: Optional[str] = None):
+        steps = kwargs['steps'] if operation == 'pipeline' else [dict(kwargs, operation=operation)]
+        if cache_key:
+            with timer.stage('cache'):
+                hit = self.cache.fetch(cache_key, output_path)
+            if hit:
+                return
+
+        # A single decode and a single encode regardless of how many steps were requested
+        with timer.stage('open'):
+            img, oversized = self._open(input_path)
+        with img:
+            exif, orientation = self._orientation(img, steps)
+            plan, output_format = self.plan_pipeline(steps, img.size, orientation)
+            if (any(step.get('lossless') for step in steps) and img.format == 'JPEG'
+                    and all(step['operation'] == 'transpose' for step in plan)
+                    and (output_format or self._format_for(output_path)) == 'JPEG'):
+                with timer.stage('transform'):
+                    lossless = self._transpose_jpeg(input_path, output_path, plan[0] if plan else None)
+                if lossless:
+                    if cache_key:
+                        with timer.stage('cache'):
+                            self.cache.store(cache_key, output_path)
+                    return
+            self._prepare_decode(img, plan)
+            if oversized and self._exceeds_tile_budget(img) and not TiledProcessor.bounded(
+                    img, plan, output_format or self._format_for(output_path)):
+                raise Image.DecompressionBombError(
+                    f"{img.width}x{img.height} exceeds the pixel limit and this operation can't stay "
+                    f"within the tile budget for it")
+            if self._needs_tiling(img, plan):
+                TiledProcessor(self, self.tile_budget).execute(input_path, img, plan, output_format,
+                                                               output_path, timer)
+                if cache_key:
+                    with timer.stage('cache'):
+                        self.cache.store(cache_key, output_path)
+                return
+
+            result = self._run_plan(img, plan, timer)
+            with timer.stage('encode'):
+                result.save(output_path, format=output_format, **self._save_params(exif))
+
+        if cache_key:
+            with timer.stage('cache'):
+                self.cache.store(cache_key, output_path)
+
+    def _open(self, input_path: str) -> tuple[Image.Image, bool]:
+        # Returns the image and whether it is past Pillow's decompression-bomb limit
+        try:
+            return Image.open(input_path), False
+        except Image.DecompressionBombError:
+            if not (self.allow_large_images and self.tile_budget):
+                raise
+        # Opt-in: open past the limit; _render still refuses plans that would decode it whole
+        with _pixel_limit_lock:
+            limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+            try:
+                return Image.open(input_path), True
+            finally:
+                Image.MAX_IMAGE_PIXELS = limit
+
+    @staticmethod
+    def _format_for(path: str) -> Optional[str]:
+        return Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+
+    def _orientation(self, img: Image.Image, steps: List[Dict]) -> tuple:
+        if not any(step.get('operation') == 'orient' for step in steps):
+            return None, 1
+        exif = img.getexif()
+        if img.format == 'TIFF':
+            # Pillow's TIFF decoder turns the frame upright itself (img.size already is); nothing left to do
+            return exif, 1
+        return exif, exif.get(self.EXIF_ORIENTATION, 1)
+
+    def _run_plan(self, img: Image.Image, plan: List[Dict], timer: StageTimer) -> Image.Image:
+        with timer.stage('decode'):
+            img.load()
+            timer.track_image(img)
+        with timer.stage('transform'):
+            result = img
+            for step in plan:
+                result = self._apply_step(result, step)
+                timer.track_image(result)
+        return result
+
+    def _save_params(self, exif: Optional[Image.Exif]) -> Dict:
+        if not exif:
+            return {}
+        # Keep the camera metadata, minus the rotation that has now been applied
+        exif[self.EXIF_ORIENTATION] = 1
+        for tag in self.TIFF_LAYOUT_TAGS.intersection(exif):
+            del exif[tag]
+        return {'exif': exif}
+
+    def process_bytes(self, data, operation: str, out=None, raw: Optional[Dict] = None,
+                      timer: Optional[StageTimer] = None, **kwargs) -> Optional[Union[bytes, int]]:
+        # data: bytes, bytearray, memoryview or mmap. Returns the encoded image, or the byte count
+        # when out (a writable stream, or a bytearray/memoryview to fill) is given
+        timer = timer or StageTimer()
+        try:
+            return self._execute_bytes(data, operation, kwargs, out, raw, timer)
+        except Exception as e:
+            logging.error(f"Processing error: {e}")
+            return None
+
+    @staticmethod
+    @contextmanager
+    def map_file(path: str) -> Iterator[mmap.mmap]:
+        # Pages are faulted in from the page cache as the decoder reaches them; nothing is read up front
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+    def _execute_bytes(self, data, operation: str, kwargs: Dict, out, raw: Optional[Dict],
+                       timer: StageTimer) -> Union[bytes, int]:
+        # No paths, so no cache, tiling, jpegtran or history; those stay with process_image
+        if operation not in self.STEP_OPERATIONS + ('pipeline',):
+            raise ValueError(f"Operation not available for in-memory images: {operation}")
+        steps = kwargs['steps'] if operation == 'pipeline' else [dict(kwargs, operation=operation)]
+        source = None
+        with timer.stage('open'):
+            if raw:
+                # Shares the caller's memory for modes Pillow can map directly (L, RGBA, RGBX, ...)
+                timer.bytes_read = memoryview(data).nbytes
+                img = Image.frombuffer(raw['mode'], tuple(raw['size']), data, 'raw',
+                                       raw.get('rawmode', raw['mode']), raw.get('stride', 0), 1)
+            else:
+                source = MemoryFile(data)
+                timer.bytes_read = source.end
+                img = Image.open(source)
+        try:
+            with img:
+                exif, orientation = self._orientation(img, steps)
+                plan, output_format = self.plan_pipeline(steps, img.size, orientation)
+                output_format = output_format or img.format or 'PNG'
+                self._prepare_decode(img, plan)
+                result = self._run_plan(img, plan, timer)
+                with timer.stage('encode'):
+                    params = self._save_params(exif)
+                    if out is None:
+                        buffer = io.BytesIO()
+                        result.save(buffer, format=output_format, **params)
+                        # getvalue() hands over BytesIO's own buffer rather than copying it
+                        encoded = buffer.getvalue()
+                        timer.bytes_written = len(encoded)
+                        return encoded
+                    if hasattr(out, 'write') and getattr(out, 'seekable', lambda: False)():
+                        start = out.tell()
+                        result.save(out, format=output_format, **params)
+                        timer.bytes_written = out.tell() - start
+                        return timer.bytes_written
+                    if hasattr(out, 'write'):
+                        # Encoders that seek back need a seekable stream; the rest stream through
+                        target = CountingWriter(out)
+                        result.save(target, format=output_format, **params)
+                        timer.bytes_written = target.count
+                        return timer.bytes_written
+                    with MemoryFile(out, writable=True) as target:
+                        result.save(target, format=output_format, **params)
+                        timer.bytes_written = target.end
+                    return timer.bytes_written
+        finally:
+            if source:
+                source.close()
+
+    def _execute_renditions(self, input_path: str, kwargs: Dict, timer: StageTimer) -> str:
+        # Decodes once and writes {stem}_{ext}_{width}w.{format} per width and format, plus a JSON manifest
+        formats = [fmt.upper() for fmt in kwargs['formats']]
+        unknown = [fmt for fmt in formats if fmt not in self.RENDITION_FORMATS]
+        if unknown or not formats:
+            raise ValueError(f"Unsupported rendition formats: {', '.join(unknown) or 'none given'}")
+        if not kwargs['widths'] or any(int(width) <= 0 for width in kwargs['widths']):
+            raise ValueError("Rendition widths must be positive")
+        if kwargs.get('tier', 'full') not in self.RESIZE_TIERS:
+            raise ValueError(f"Unknown resize tier: {kwargs['tier']}")
+        directory = os.path.dirname(input_path)
+        # Names are stable so pages can link them; the source extension keeps a.jpg and a.png apart
+        stem, extension = os.path.splitext(os.path.basename(input_path))
+        name = f"{stem}_{extension[1:].lower()}" if extension else stem
+
+        with timer.stage('open'):
+            img = Image.open(input_path)
+        with img:
+            width, height = img.size
+            # Never upscale: widths past the source collapse into one full-width rendition
+            widths = sorted({min(int(w), width) for w in kwargs['widths']}, reverse=True)
+            sizes = [(w, max(1, round(w * height / width))) for w in widths]
+            outputs = [(size, fmt, os.path.join(directory, f"{name}_{size[0]}w{self.RENDITION_FORMATS[fmt]}"))
+                       for size in sizes for fmt in formats]
+
+            cache_keys = {}
+            if self.cache:
+                with timer.stage('cache'):
+                    for size, fmt, path in outputs:
+                        cache_keys[path] = self.cache.make_key(input_path, 'renditions',
+                                                               dict(kwargs, width=size[0], format=fmt))
+                    hit = all(self.cache.fetch(cache_keys[path], path) for _, _, path in outputs)
+            if not (self.cache and hit):
+                self._render_renditions(img, sizes, formats, outputs, kwargs, timer)
+                if self.cache:
+                    with timer.stage('cache'):
+                        for _, _, path in outputs:
+                            self.cache.store(cache_keys[path], path)
+
+        manifest = {
+            'source': os.path.basename(input_path),
+            'width': width,
+            'height': height,
+            'renditions': [{'width': size[0], 'height': size[1], 'format': fmt,
+                            'path': os.path.basename(path), 'bytes': os.path.getsize(path)}
+                           for size, fmt, path in outputs],
+        }
+        manifest_path = os.path.join(directory, f"{name}_renditions.json")
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, manifest_path)
+        timer.bytes_written = sum(entry['bytes'] for entry in manifest['renditions'])
+        return manifest_path
+
+    def _render_renditions(self, img: Image.Image, sizes: List[tuple], formats: List[str],
+                           outputs: List[tuple], kwargs: Dict, timer: StageTimer):
+        # The largest rendition decides how far JPEG can draft-decode
+        first = {'operation': 'resize', 'width': sizes[0][0], 'height': sizes[0][1],
+                 'tier': kwargs.get('tier', 'full')}
+        plan = [first]
+        self._prepare_decode(img, plan)
+        with timer.stage('decode'):
+            img.load()
+            timer.track_image(img)
+        source = img
+        if img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+            source = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+
+        paths = {(size, fmt): path for size, fmt, path in outputs}
+        renditions = []
+        # Encoders release the GIL, so each size's formats encode while the next size is resampled
+        with ThreadPoolExecutor(max_workers=min(len(outputs), os.cpu_count() or 1)) as pool:
+            futures = []
+            for size in sizes:
+                with timer.stage('transform'):
+                    base = next((r for r in reversed(renditions)
+                                 if r.width >= self.RENDITION_CASCADE_RATIO * size[0]), source)
+                    step = dict(plan[0] if base is source else first, width=size[0], height=size[1])
+                    if base is source and 'box' not in step and size == source.size:
+                        rendition = source
+                    else:
+                        rendition = self._apply_step(base, step)
+                    timer.track_image(rendition)
+                renditions.append(rendition)
+                for fmt in formats:
+                    futures.append(pool.submit(self._encode_rendition, rendition, fmt, paths[(size, fmt)],
+                                               kwargs.get('quality')))
+            with timer.stage('encode'):
+                for future in futures:
+                    future.result()
+
+    @staticmethod
+    def _encode_rendition(img: Image.Image, fmt: str, path: str, quality: Optional[int] = None):
+        if fmt == 'JPEG' and img.mode in ('RGBA', 'LA'):
+            # No alpha in JPEG: flatten onto white instead of exposing colour under transparent pixels
+            background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+            img = Image.alpha_composite(background, img.convert('RGBA')).convert('RGB')
+        else:
+            # save() keeps encoder settings on the image object, so threads never share one
+            img = img.copy()
+        params = {'quality': quality} if quality and fmt in ('JPEG', 'WEBP') else {}
+        # Published names are stable, so readers must never see a half-written file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            img.save(temp_path, format=fmt, **params)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def plan_pipeline(cls, steps: List[Dict], size: tuple,
+                      orientation: int = 1) -> tuple[List[Dict], Optional[str]]:
+        plan: List[Dict] = []
+        sizes: List[tuple] = []  # Image size after each planned step
+        output_format = None
+
+        def push(step: Dict):
+            current = sizes[-1] if sizes else size
+            operation = step['operation']
+            previous = plan[-1] if plan else None
+
+            if operation == 'transpose':
+                if previous and previous['operation'] == 'transpose':
+                    plan.pop()
+                    sizes.pop()
+                    # A mirror reverses the direction of every rotation applied before it
+                    flip = previous['flip'] != step['flip']
+                    angle = (step['angle'] + (-previous['angle'] if step['flip'] else previous['angle'])) % 360
+                    if flip or angle:
+                        push({'operation': 'transpose', 'angle': angle, 'flip': flip})
+                    return
+                sizes.append(current[::-1] if step['angle'] in (90, 270) else current)
+            elif operation == 'resize':
+                if previous and previous['operation'] == 'resize':
+                    # Only the last size matters; resampling twice just loses detail
+                    plan.pop()
+                    sizes.pop()
+                    push(step)
+                    return
+                if (previous and previous['operation'] == 'transpose'
+                        and step['width'] * step['height'] < current[0] * current[1]):
+                    # Shrink first so the transpose touches fewer pixels
+                    plan.pop()
+                    sizes.pop()
+                    if previous['angle'] in (90, 270):
+                        step = dict(step, width=step['height'], height=step['width'])
+                    push(step)
+                    push(previous)
+                    return
+                sizes.append((step['width'], step['height']))
+            elif operation == 'rotate':
+                radians = math.radians(step['angle'])
+                w, h = current
+                sizes.append((math.ceil(abs(w * math.cos(radians)) + abs(h * math.sin(radians))),
+                              math.ceil(abs(w * math.sin(radians)) + abs(h * math.cos(radians)))))
+            elif operation == 'enhance':
+                if EnhancementEngine.is_identity(step):
+                    return
+                if previous and previous['operation'] == 'enhance':
+                    # A run of enhancements is one step; the engine fuses its point-wise stages into one pass
+                    last = previous['stages'][-1]
+                    if cls._can_fuse_enhancements(last, step):
+                        previous['stages'].pop()
+                        step = dict(step, factor=last['factor'] * step['factor'])
+                        if EnhancementEngine.is_identity(step):
+                            if not previous['stages']:
+                                plan.pop()
+                                sizes.pop()
+                            return
+                    previous['stages'].append(step)
+                    return
+                step = {'operation': 'enhance', 'stages': [step]}
+                sizes.append(current)
+            plan.append(step)
+
+        for step in steps:
+            operation = step.get('operation')
+            if operation not in cls.STEP_OPERATIONS:
+                raise ValueError(f"Unknown pipeline step: {operation}")
+            if operation == 'resize' and step.get('tier', 'full') not in cls.RESIZE_TIERS:
+                raise ValueError(f"Unknown resize tier: {step['tier']}")
+            if operation == 'enhance':
+                EnhancementEngine.validate(step)
+            if operation == 'convert':
+                # Conversion only decides the encoder; the last one wins
+                output_format = step['format']
+            elif operation == 'rotate':
+                angle = step['angle'] % 360
+                if angle % 90 == 0:
+                    if angle:
+                        push({'operation': 'transpose', 'angle': int(angle), 'flip': False})
+                else:
+                    push(dict(step))
+            elif operation == 'flip':
+                if step.get('direction') not in cls.FLIPS:
+                    raise ValueError(f"Unknown flip direction: {step.get('direction')}")
+                flip, angle = cls.FLIPS[step['direction']]
+                push({'operation': 'transpose', 'angle': angle, 'flip': flip})
+            elif operation == 'orient':
+                # Only meaningful once, as the first transform; later ones see upright pixels
+                if orientation in cls.ORIENTATIONS:
+                    flip, angle = cls.ORIENTATIONS[orientation]
+                    push({'operation': 'transpose', 'angle': angle, 'flip': flip})
+                    orientation = 1
+            else:
+                push(dict(step))
+        return plan, output_format
+
+    def _prepare_decode(self, img: Image.Image, plan: List[Dict]):
+        # Must run before the first load(): lets JPEG decode straight at 1/2, 1/4 or 1/8 scale
+        over_budget = self._exceeds_tile_budget(img)
+        index = 0
+        if over_budget:
+            # Point-wise enhancements ahead of the downscale then run on the smaller frame too
+            while (index < len(plan) and plan[index]['operation'] == 'enhance' and all(
+                    s['enhancement_type'] in TiledProcessor.POINTWISE for s in plan[index]['stages'])):
+                index += 1
+        if index == len(plan) or plan[index]['operation'] != 'resize':
+            return
+        step = plan[index]
+        tier = self.RESIZE_TIERS[step.get('tier', 'full')]
+        if tier is None:
+            if not over_budget:
+                return
+            # Over the memory budget a 2x-oversampled DCT decode beats a full-frame one
+            tier = self.RESIZE_TIERS['balanced']
+        oversample = tier[0]
+        width, height = step['width'] * oversample, step['height'] * oversample
+        if img.width < 2 * width or img.height < 2 * height:
+            return
+        drafted = img.draft(img.mode, (width, height))
+        if drafted:
+            # Scaled DCT rounds the size up; the box maps the original frame onto it
+            plan[index] = dict(step, box=drafted[1])
+
+    def _exceeds_tile_budget(self, img: Image.Image) -> bool:
+        return bool(self.tile_budget) and img.width * img.height * len(img.getbands()) > self.tile_budget
+
+    def _needs_tiling(self, img: Image.Image, plan: List[Dict]) -> bool:
+        return self._exceeds_tile_budget(img) and TiledProcessor.supports(img, plan)
+
+    @staticmethod
+    def _can_fuse_enhancements(first: Dict, second: Dict) -> bool:
+        # Point-wise stages already compose exactly in the lookup table. Colour blends towards
+        # a fixed grey, so two of them compose exactly while nothing clips
+        if first['enhancement_type'] != 'color' or second['enhancement_type'] != 'color':
+            return False
+        return 0 <= first['factor'] <= 1 and 0 <= second['factor'] <= 1
+
+    def _apply_step(self, img: Image.Image, step: Dict) -> Image.Image:
+        operation = step['operation']
+        if operation == 'transpose':
+            return img.transpose(self.TRANSPOSES[(step['flip'], step['angle'])])
+        if operation == 'resize':
+            tier = self.RESIZE_TIERS[step.get('tier', 'full')]
+            if tier is None:
+                # A box is only present when the decode was drafted; it maps the original frame onto it
+                return img.resize((step['width'], step['height']), box=step.get('box'))
+            _, reducing_gap, resample = tier
+            return img.resize((step['width'], step['height']), resample=resample,
+                              box=step.get('box'), reducing_gap=reducing_gap)
+        if operation == 'rotate':
+            return img.rotate(step['angle'], expand=True)
+        if operation == 'enhance':
+            return EnhancementEngine.apply(img, step['stages'])
+        raise ValueError(f"Unknown pipeline step: {operation}")
+
+    @staticmethod
+    def _apply_enhancement(img: Image.Image, enhancement_type: str, factor: float = 1.0,
+                           **params) -> Image.Image:
+        # The single-enhancement entry point; levels also takes black= and white=
+        stage = dict(params, enhancement_type=enhancement_type, factor=factor)
+        EnhancementEngine.validate(stage)
+        return EnhancementEngine.apply(img, [stage])
+
+    def _transpose_jpeg(self, input_path: str, output_path: str, step: Optional[Dict]) -> bool:
+        # Rearranges DCT coefficients without decoding, so no generation loss; falls back to pixels
+        # when jpegtran is missing or the size isn't a whole number of MCUs (-perfect)
+        jpegtran = shutil.which('jpegtran')
+        if not jpegtran:
+            logging.warning("jpegtran not found; using the pixel path for a lossless transpose")
+            return False
+        transform = self.JPEGTRAN_TRANSFORMS[(step['flip'], step['angle'])] if step else []
+        completed = subprocess.run([jpegtran, '-copy', 'all', '-perfect'] + transform
+                                   + ['-outfile', output_path, input_path], capture_output=True)
+        if completed.returncode != 0:
+            logging.warning(f"jpegtran could not transform {input_path} losslessly: "
+                            f"{completed.stderr.decode(errors='replace').strip()}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return False
+        self._reset_jpeg_orientation(output_path)
+        return True
+
+    @classmethod
+    def _reset_jpeg_orientation(cls, path: str):
+        # Patched in place: the value lives in the IFD entry itself, so no offsets move
+        with open(path, 'r+b') as f:
+            if f.read(2) != b'\xff\xd8':
+                return
+            while True:
+                header = f.read(4)
+                if len(header) < 4 or header[0] != 0xFF or header[1] in (0xD9, 0xDA):
+                    return
+                length = struct.unpack('>H', header[2:])[0]
+                start = f.tell()
+                if header[1] == 0xE1:
+                    segment = f.read(length - 2)
+                    if segment.startswith(b'Exif\0\0') and len(segment) >= 14:
+                        order = '<' if segment[6:8] == b'II' else '>'
+                        ifd = 6 + struct.unpack(order + 'I', segment[10:14])[0]
+                        count = struct.unpack(order + 'H', segment[ifd:ifd + 2])[0]
+                        for entry in range(ifd + 2, ifd + 2 + 12 * count, 12):
+                            tag, kind = struct.unpack(order + 'HH', segment[entry:entry + 4])
+                            if tag == cls.EXIF_ORIENTATION and kind == 3:
+                                f.seek(start + entry + 8)
+                                f.write(struct.pack(order + 'H', 1))
+                                return
+                f.seek(start + length - 2)
+
+    @classmethod
+    def is_output(cls, path: str) -> bool:
+        return cls.OUTPUT_STEM.search(os.path.splitext(os.path.basename(path))[0]) is not None
+
     def _generate_output_path(self, input_path: str, operation: str) -> str:
         directory = os.path.dirname(input_path)
         filename = os.path.basename(input_path)
         name, ext = os.path.splitext(filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        return os.path.join(directory, f"{name}_{operation}_{timestamp}{ext}")
+        # The name is reserved by creating the file, so the same input processed twice in one
+        # second (even by two workers) gets _2, _3, ... instead of overwriting the first result
+        attempt = 1
+        while True:
+            suffix = f"_{attempt}" if attempt > 1 else ''
+            path = os.path.join(directory, f"{name}_{operation}_{timestamp}{suffix}{ext}")
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return path
+            except FileExistsError:
+                attempt += 1
 
     def _record_operation(self, input_path: str, output_path: str, operation: str, params: Dict):
-        self.history.append({
-            'timestamp': datetime.now().isoformat(),
-            'operation': operation,
-            'input': input_path,
-            'output': output_path,
-            'parameters': params
-        })
-        self.save_history()
+        if self.history is None:
+            return
+        try:
+            self.history.append({
+                'timestamp': datetime.now().isoformat(),
+                'operation': operation,
+                'input': input_path,
+                'output': output_path,
+                'parameters': params
+            })
+        except Exception as e:
+            logging.error(f"History save failed: {e}")
+
+class EnhancementEngine:
+    # Point-wise adjustments compile into one lookup table, so a run of them costs a single point() pass
+    LUT_TYPES = ('brightness', 'contrast', 'gamma', 'levels')
+    TYPES = LUT_TYPES + ('color', 'sharpness')
+    MODES = ('L', 'LA', 'RGB', 'RGBA')
+    RAMP = Image.frombytes('L', (256, 1), bytes(range(256)))
+    # Weights convert('L') uses, so the contrast pivot matches ImageEnhance.Contrast
+    LUMA = (19595 / 65536, 38470 / 65536, 7471 / 65536)
+
+    @classmethod
+    def validate(cls, stage: Dict):
+        kind = stage.get('enhancement_type')
+        if kind not in cls.TYPES:
+            raise ValueError(f"Unknown enhancement: {kind}")
+        if kind == 'levels':
+            if not 0 <= stage['black'] < stage['white'] <= 255:
+                raise ValueError("Levels need 0 <= black < white <= 255")
+        elif kind == 'gamma' and stage['factor'] <= 0:
+            raise ValueError("Gamma must be positive")
 
     @staticmethod
-    def _apply_enhancement(img: Image.Image, enhancement_type: str, factor: float) -> Image.Image:
+    def is_identity(stage: Dict) -> bool:
+        if stage['enhancement_type'] == 'levels':
+            return stage['black'] == 0 and stage['white'] == 255
+        return stage['factor'] == 1.0
+
+    @classmethod
+    def groups(cls, stages: List[Dict]) -> Iterator[List[Dict]]:
+        group = []
+        for stage in stages:
+            if stage['enhancement_type'] in cls.LUT_TYPES:
+                group.append(stage)
+                continue
+            if group:
+                yield group
+                group = []
+            yield [stage]
+        if group:
+            yield group
+
+    @classmethod
+    def needs_histogram(cls, group: List[Dict]) -> bool:
+        return any(stage['enhancement_type'] == 'contrast' for stage in group)
+
+    @classmethod
+    def apply(cls, img: Image.Image, stages: List[Dict]) -> Image.Image:
+        for group in cls.groups(stages):
+            if group[0]['enhancement_type'] in cls.LUT_TYPES and img.mode in cls.MODES:
+                histogram = img.histogram() if cls.needs_histogram(group) else None
+                img = img.point(cls.compile(group, img.mode, histogram))
+            else:
+                for stage in group:
+                    img = cls.apply_single(img, stage)
+        return img
+
+    @classmethod
+    def apply_single(cls, img: Image.Image, stage: Dict) -> Image.Image:
+        kind = stage['enhancement_type']
+        if kind == 'color' and img.mode in ('L', 'LA'):
+            # Already grey: the degenerate image is the image itself
+            return img
+        if kind == 'color' and img.mode == 'RGB':
+            # One matrix pass instead of a grey copy plus a blend; within one level of ImageEnhance
+            factor = stage['factor']
+            red, green, blue = ((1 - factor) * weight for weight in cls.LUMA)
+            return img.convert('RGB', (factor + red, green, blue, 0,
+                                       red, factor + green, blue, 0,
+                                       red, green, factor + blue, 0))
+        if kind in ('gamma', 'levels'):
+            if img.mode not in cls.MODES:
+                raise ValueError(f"{kind} is not supported for mode {img.mode}")
+            return img.point(cls.compile([stage], img.mode))
         enhancer_map = {
             'brightness': ImageEnhance.Brightness,
             'contrast': ImageEnhance.Contrast,
             'sharpness': ImageEnhance.Sharpness,
             'color': ImageEnhance.Color
         }
-        enhancer = enhancer_map[enhancement_type](img)
-        return enhancer.enhance(factor)
+        return enhancer_map[kind](img).enhance(stage['factor'])
+
+    @classmethod
+    def compile(cls, stages: List[Dict], mode: str, histogram: Optional[List[int]] = None) -> List[int]:
+        # The same curve applies to every colour band; alpha passes through
+        table = list(range(256))
+        for stage in stages:
+            mean = cls.luma_mean(histogram, table, mode) if stage['enhancement_type'] == 'contrast' else None
+            curve = cls.curve(stage, mean)
+            table = [curve[value] for value in table]
+        colour_bands = Image.getmodebands(mode) - ('A' in mode)
+        return table * colour_bands + (list(range(256)) if 'A' in mode else [])
+
+    @classmethod
+    def luma_mean(cls, histogram: List[int], table: List[int], mode: str) -> int:
+        # The histogram is taken once, before the group; earlier stages are applied to it, not the pixels
+        weights = (1.0,) if mode in ('L', 'LA') else cls.LUMA
+        total = sum(histogram[:256]) or 1
+        mean = 0.0
+        for band, weight in enumerate(weights):
+            counts = histogram[band * 256:(band + 1) * 256]
+            mean += weight * sum(count * table[value] for value, count in enumerate(counts)) / total
+        return int(mean + 0.5)
+
+    @classmethod
+    def curve(cls, stage: Dict, mean: Optional[int] = None) -> List[int]:
+        kind = stage['enhancement_type']
+        if kind in ('brightness', 'contrast'):
+            # Blending the ramp reproduces ImageEnhance's float rounding exactly
+            degenerate = Image.new('L', (256, 1), mean if kind == 'contrast' else 0)
+            return list(Image.blend(degenerate, cls.RAMP, stage['factor']).tobytes())
+        if kind == 'gamma':
+            return [round(255 * (value / 255) ** (1 / stage['factor'])) for value in range(256)]
+        if kind == 'levels':
+            black, white = stage['black'], stage['white']
+            return [min(255, max(0, round((value - black) * 255 / (white - black)))) for value in range(256)]
+        raise ValueError(f"Not a point-wise enhancement: {kind}")
+
+class MemoryFile(io.RawIOBase):
+    # File object over bytes, a memoryview or an mmap without copying the buffer. Reads copy only
+    # the slice asked for; writes go straight into the caller's buffer and fail once it is full
+    def __init__(self, buffer, writable: bool = False):
+        super().__init__()
+        self.view = memoryview(buffer).cast('B')
+        if writable and self.view.readonly:
+            raise ValueError("Output buffer is read-only")
+        self._writable = writable
+        self.position = 0
+        self.end = 0 if writable else len(self.view)
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return self._writable
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        stop = self.end if size is None or size < 0 else min(self.end, self.position + size)
+        chunk = self.view[self.position:stop].tobytes()
+        self.position += len(chunk)
+        return chunk
+
+    def readinto(self, b) -> int:
+        count = max(0, min(len(b), self.end - self.position))
+        b[:count] = self.view[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def write(self, b) -> int:
+        if not self._writable:
+            raise io.UnsupportedOperation("write")
+        data = memoryview(b).cast('B')
+        if self.position + len(data) > len(self.view):
+            raise ValueError(f"Output buffer is too small ({len(self.view)} bytes)")
+        self.view[self.position:self.position + len(data)] = data
+        self.position += len(data)
+        self.end = max(self.end, self.position)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.end}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def close(self):
+        # Releasing the view lets the caller close or resize its mmap/bytearray again
+        if not self.closed:
+            self.view.release()
+        super().close()
+
+class CountingWriter:
+    # Counts what reaches a stream that can't report its position (pipe, socket). No fileno(),
+    # so Pillow's encoders go through write() instead of writing to the descriptor directly
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, b) -> int:
+        written = self.stream.write(b)
+        written = memoryview(b).nbytes if written is None else written
+        self.count += written
+        return written
+
+    def flush(self):
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+class PngStreamWriter:
+    COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+
+    def __init__(self, path: str, size: tuple, mode: str, level: int = 6):
+        self.file = open(path, 'wb')
+        self.size = size
+        self.mode = mode
+        self.row_bytes = size[0] * len(mode)
+        self._compressor = zlib.compressobj(level)
+        self._previous_row = Image.new(mode, (size[0], 1))
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', size[0], size[1], 8, self.COLOR_TYPES[mode], 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self.file.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data)))
+
+    def write_rows(self, img: Image.Image):
+        # PNG 'Up' filter: each row is stored as the byte-wise difference from the row above
+        above = Image.new(self.mode, img.size)
+        above.paste(self._previous_row, (0, 0))
+        above.paste(img.crop((0, 0, img.width, img.height - 1)), (0, 1))
+        data = ImageChops.subtract_modulo(img, above).tobytes()
+        self._previous_row = img.crop((0, img.height - 1, img.width, img.height))
+        rows = b''.join(b'\x02' + data[i:i + self.row_bytes] for i in range(0, len(data), self.row_bytes))
+        compressed = self._compressor.compress(rows)
+        if compressed:
+            self._chunk(b'IDAT', compressed)
+
+    def close(self):
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+        self.file.close()
+
+class TiffTileWriter:
+    PHOTOMETRIC = {'L': 1, 'LA': 1, 'RGB': 2, 'RGBA': 2}
+    SHORT, LONG = 3, 4
+
+    def __init__(self, path: str, size: tuple, mode: str, tile: int = 256, level: int = 6):
+        self.file = open(path, 'wb')
+        self.size = size
+        self.mode = mode
+        self.tile = tile
+        self.level = level
+        self.columns = math.ceil(size[0] / tile)
+        count = self.columns * math.ceil(size[1] / tile)
+        self.offsets = [0] * count
+        self.byte_counts = [0] * count
+        self.file.write(b'II*\x00\x00\x00\x00\x00')  # IFD offset is patched in close()
+
+    def write_block(self, x: int, y: int, img: Image.Image):
+        # Blocks start on tile boundaries; crop() zero-pads the partial tiles at the edges
+        for ty in range(0, img.height, self.tile):
+            for tx in range(0, img.width, self.tile):
+                data = zlib.compress(img.crop((tx, ty, tx + self.tile, ty + self.tile)).tobytes(), self.level)
+                index = (y + ty) // self.tile * self.columns + (x + tx) // self.tile
+                self.offsets[index] = self.file.tell()
+                self.byte_counts[index] = len(data)
+                self.file.write(data)
+        if self.file.tell() > 0xFFFFFFFF:
+            raise ValueError("Tiled TIFF output exceeds 4 GB")
+
+    def close(self):
+        bands = len(self.mode)
+        fields = [
+            (256, self.LONG, [self.size[0]]),
+            (257, self.LONG, [self.size[1]]),
+            (258, self.SHORT, [8] * bands),
+            (259, self.SHORT, [8]),  # Adobe Deflate
+            (262, self.SHORT, [self.PHOTOMETRIC[self.mode]]),
+            (277, self.SHORT, [bands]),
+            (284, self.SHORT, [1]),
+            (322, self.LONG, [self.tile]),
+            (323, self.LONG, [self.tile]),
+            (324, self.LONG, self.offsets),
+            (325, self.LONG, self.byte_counts),
+        ]
+        if 'A' in self.mode:
+            fields.append((338, self.SHORT, [2]))  # Unassociated alpha
+
+        entries = []
+        for tag, field_type, values in fields:
+            data = struct.pack(f"<{len(values)}{'H' if field_type == self.SHORT else 'I'}", *values)
+            if len(data) > 4:
+                self._align()
+                entries.append((tag, field_type, len(values), struct.pack('<I', self.file.tell())))
+                self.file.write(data)
+            else:
+                entries.append((tag, field_type, len(values), data.ljust(4, b'\x00')))
+        self._align()
+        ifd_offset = self.file.tell()
+        self.file.write(struct.pack('<H', len(entries)))
+        for tag, field_type, count, value in entries:
+            self.file.write(struct.pack('<HHI', tag, field_type, count) + value)
+        self.file.write(struct.pack('<I', 0))
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', ifd_offset))
+        self.file.close()
+
+    def _align(self):
+        if self.file.tell() % 2:
+            self.file.write(b'\x00')
+
+class StripReader:
+    PNG_CHUNK = 1 << 16
+
+    def __init__(self, path: str, img: Image.Image, timer: StageTimer):
+        self.path = path
+        self.img = img
+        self.timer = timer
+        self.size = img.size
+        self.layout = self._raw_layout(img)
+        self.png = self.layout is None and self._png_sequential(img)
+        self._png_state = None
+        self._spill_path = None
+        if self.layout is None and not self.png:
+            # Other compressed codecs can't be entered mid-stream: decode once and hand out crops
+            with timer.stage('decode'):
+                img.load()
+            timer.track_image(img)
+
+    @classmethod
+    def streamable(cls, img: Image.Image) -> bool:
+        return cls._raw_layout(img) is not None or cls._png_sequential(img)
+
+    @staticmethod
+    def _raw_layout(img: Image.Image) -> Optional[List[tuple]]:
+        # Uncompressed TIFF, PPM/PGM and BMP keep full-width row bands at fixed file offsets:
+        # [(y0, y1, offset, rawmode, stride, orientation), ...]
+        if (img.format == 'TIFF'
+                and img.getexif().get(ImageProcessor.EXIF_ORIENTATION, 1) in ImageProcessor.ORIENTATIONS):
+            # The rows are stored sideways or mirrored; Pillow's decoder turns them upright, raw reads wouldn't
+            return None
+        bands = []
+        for codec, extents, offset, args in img.tile:
+            if codec != 'raw' or extents[0] != 0 or extents[2] != img.width:
+                return None
+            rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+            if not stride:
+                if not (rawmode.isalpha() and rawmode.isupper()):
+                    return None
+                stride = img.width * len(rawmode)
+            bands.append((extents[1], extents[3], offset, rawmode, stride, orientation))
+        return sorted(bands) or None
+
+    @staticmethod
+    def _png_sequential(img: Image.Image) -> bool:
+        # Non-interlaced 8-bit PNG rows can be inflated and unfiltered in order, one strip at a time
+        if img.format != 'PNG' or img.info.get('interlace') or getattr(img, 'n_frames', 1) != 1:
+            return False
+        return (len(img.tile) == 1 and img.tile[0][0] == 'zip' and img.tile[0][3] == img.mode
+                and img.mode in PngStreamWriter.COLOR_TYPES and img.tile[0][1] == (0, 0) + img.size)
+
+    @property
+    def streaming(self) -> bool:
+        return self.layout is not None or self.png
+
+    def random_access(self, rows: int):
+        # Bottom-up and column-band passes would re-inflate a PNG from the top for every strip;
+        # decode it once into an uncompressed file instead (placed by TMPDIR; keep that off tmpfs)
+        if not self.png:
+            return
+        fd, spill_path = tempfile.mkstemp(suffix='.raw', prefix='cc_strips_')
+        self._spill_path = spill_path
+        with os.fdopen(fd, 'wb') as f:
+            for _, _, strip in self.windows(rows):
+                f.write(strip.tobytes())
+        self._close_png()
+        row_bytes = self.size[0] * len(self.img.mode)
+        self.path, self.png = spill_path, False
+        self.layout = [(0, self.size[1], 0, self.img.mode, row_bytes, 1)]
+
+    def close(self):
+        self._close_png()
+        if self._spill_path and os.path.exists(self._spill_path):
+            os.remove(self._spill_path)
+
+    def windows(self, rows: int, from_bottom: bool = False) -> Iterator[tuple]:
+        if from_bottom:
+            self.random_access(rows)
+        height = self.size[1]
+        for start in range(0, height, rows):
+            y0, y1 = (max(0, height - start - rows), height - start) if from_bottom else (start, min(height, start + rows))
+            with self.timer.stage('decode'):
+                strip = self._read(y0, y1)
+            self.timer.track_image(strip)
+            yield y0, y1, strip
+
+    def _read(self, y0: int, y1: int) -> Image.Image:
+        width = self.size[0]
+        if self.png:
+            return self._read_png(y0, y1)
+        if self.layout is None:
+            return self.img.crop((0, y0, width, y1))
+
+        strip = None
+        with open(self.path, 'rb') as fp:
+            for b0, b1, offset, rawmode, stride, orientation in self.layout:
+                top, bottom = max(b0, y0), min(b1, y1)
+                if top >= bottom:
+                    continue
+                # Bottom-up bands (BMP) store their last row first
+                fp.seek(offset + (top - b0 if orientation > 0 else b1 - bottom) * stride)
+                data = fp.read((bottom - top) * stride)
+                piece = Image.frombytes(self.img.mode, (width, bottom - top), data, 'raw', rawmode, stride, orientation)
+                if (top, bottom) == (y0, y1):
+                    return piece
+                if strip is None:
+                    strip = Image.new(self.img.mode, (width, y1 - y0))
+                strip.paste(piece, (0, top - y0))
+        return strip
+
+    def _read_png(self, y0: int, y1: int) -> Image.Image:
+        if self._png_state is None or self._png_state['row'] > y0:
+            self._close_png()
+            fp = open(self.path, 'rb')
+            # The tile offset points at the first IDAT's data, just past its length and type
+            fp.seek(self.img.tile[0][2] - 8)
+            self._png_state = {'fp': fp, 'inflate': zlib.decompressobj(), 'remaining': 0, 'ended': False,
+                               'row': 0, 'previous': None}
+        state = self._png_state
+        while state['row'] < y0:
+            # Skipped rows still have to be unfiltered: each one is the reference for the next
+            self._read_png(state['row'], min(y0, state['row'] + y1 - y0))
+        filtered = self._inflate_rows(y1 - y0, 1 + self.size[0] * len(self.img.mode))
+
+        # Unfiltering is sequential, so Pillow's own decoder does it: the previous window's last
+        # row goes in front as an unfiltered reference row, then is cropped away again
+        rows = y1 - y0
+        if state['previous'] is not None:
+            filtered = b'\x00' + state['previous'] + filtered
+            rows += 1
+        png = io.BytesIO()
+        png.write(b'\x89PNG\r\n\x1a\n')
+        for kind, data in ((b'IHDR', struct.pack('>IIBBBBB', self.size[0], rows, 8,
+                                                 PngStreamWriter.COLOR_TYPES[self.img.mode], 0, 0, 0)),
+                           (b'IDAT', zlib.compress(filtered, 0)), (b'IEND', b'')):
+            png.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data)))
+        png.seek(0)
+        with Image.open(png) as decoded:
+            decoded.load()
+            strip = decoded.crop((0, rows - (y1 - y0), self.size[0], rows))
+        state['previous'] = strip.crop((0, strip.height - 1, strip.width, strip.height)).tobytes()
+        return strip
+
+    def _inflate_rows(self, count: int, row_bytes: int) -> bytes:
+        state = self._png_state
+        wanted = count * row_bytes
+        data, have = [], 0
+        fp, inflate = state['fp'], state['inflate']
+        while have < wanted:
+            compressed = inflate.unconsumed_tail
+            if not compressed and not state['ended']:
+                if not state['remaining']:
+                    length, kind = struct.unpack('>I4s', fp.read(8))
+                    # IDAT chunks are consecutive; anything else means the image data is over
+                    state['ended'] = kind != b'IDAT'
+                    state['remaining'] = 0 if state['ended'] else length
+                if state['remaining']:
+                    compressed = fp.read(min(self.PNG_CHUNK, state['remaining']))
+                    state['remaining'] -= len(compressed)
+                    if not state['remaining']:
+                        fp.seek(4, os.SEEK_CUR)  # CRC
+            chunk = inflate.decompress(compressed, wanted - have)
+            if not chunk and state['ended'] and not inflate.unconsumed_tail:
+                raise ValueError("PNG image data ends before the last row")
+            data.append(chunk)
+            have += len(chunk)
+        state['row'] += count
+        return b''.join(data)
+
+    def _close_png(self):
+        if self._png_state:
+            self._png_state['fp'].close()
+            self._png_state = None
+
+class TiledProcessor:
+    POINTWISE = EnhancementEngine.LUT_TYPES + ('color',)
+    MODES = ('L', 'LA', 'RGB', 'RGBA')
+    TILE = 256
+
+    def __init__(self, processor: 'ImageProcessor', memory_budget: int):
+        self.processor = processor
+        self.memory_budget = memory_budget
+
+    @classmethod
+    def supports(cls, img: Image.Image, plan: List[Dict]) -> bool:
+        if img.mode not in cls.MODES:
+            return False
+        for step in plan:
+            operation = step['operation']
+            if operation == 'resize':
+                # Anything after a downscale runs on the small result in memory
+                return step['width'] <= img.width and step['height'] <= img.height
+            if operation == 'enhance' and all(s['enhancement_type'] in cls.POINTWISE for s in step['stages']):
+                continue
+            if operation == 'transpose' and not step['flip']:
+                continue
+            return False
+        return True
+
+    @classmethod
+    def bounded(cls, img: Image.Image, plan: List[Dict], output_format: Optional[str]) -> bool:
+        # Strips come straight from the file and the output is either small or written incrementally
+        return (cls.supports(img, plan) and StripReader.streamable(img)
+                and (any(step['operation'] == 'resize' for step in plan) or output_format in ('PNG', 'TIFF')))
+
+    def execute(self, input_path: str, img: Image.Image, plan: List[Dict], output_format: Optional[str],
+                output_path: str, timer: StageTimer):
+        reader = StripReader(input_path, img, timer)
+        try:
+            self._execute(reader, img, plan, output_format, output_path, timer)
+        finally:
+            reader.close()
+
+    def _execute(self, reader: StripReader, img: Image.Image, plan: List[Dict], output_format: Optional[str],
+                 output_path: str, timer: StageTimer):
+        resize_index = next((i for i, step in enumerate(plan) if step['operation'] == 'resize'), None)
+        if resize_index is not None:
+            result = self._downscale(reader, plan[:resize_index], plan[resize_index], timer)
+            with timer.stage('transform'):
+                for step in plan[resize_index + 1:]:
+                    result = self.processor._apply_step(result, step)
+            with timer.stage('encode'):
+                result.save(output_path, format=output_format)
+            return
+
+        # Point-wise enhancements commute with transposes, so all of them run per input strip
+        stages = self._resolve_stages(reader, self._enhancements(plan))
+        angle = sum(s['angle'] for s in plan if s['operation'] == 'transpose') % 360
+        output_format = output_format or self.processor._format_for(output_path)
+        width, height = reader.size
+        output_size = (height, width) if angle in (90, 270) else (width, height)
+
+        if output_format == 'TIFF':
+            writer = TiffTileWriter(output_path, output_size, img.mode, self.TILE)
+            for x, y, block in self._blocks(reader, stages, angle, timer, self.TILE):
+                with timer.stage('encode'):
+                    writer.write_block(x, y, block)
+            with timer.stage('encode'):
+                writer.close()
+        elif output_format == 'PNG':
+            writer = PngStreamWriter(output_path, output_size, img.mode)
+            bands = self._row_bands(reader, stages, angle, timer) if angle in (90, 270) else \
+                (block for _, _, block in self._blocks(reader, stages, angle, timer))
+            for band in bands:
+                with timer.stage('encode'):
+                    writer.write_rows(band)
+            with timer.stage('encode'):
+                writer.close()
+        else:
+            # No incremental encoder for this format: only the output frame is held in full
+            canvas = Image.new(img.mode, output_size)
+            for x, y, block in self._blocks(reader, stages, angle, timer):
+                canvas.paste(block, (x, y))
+            timer.track_image(canvas)
+            with timer.stage('encode'):
+                canvas.save(output_path, format=output_format)
+
+    def _rows(self, row_bytes: int, multiple: int = 16, share: int = 3) -> int:
+        # Each strip exists up to three times at once: decoded, enhanced and transposed
+        rows = self.memory_budget // share // max(1, row_bytes)
+        return max(multiple, rows // multiple * multiple)
+
+    def _row_bytes(self, reader: StripReader) -> int:
+        return reader.size[0] * len(reader.img.getbands())
+
+    def _blocks(self, reader: StripReader, stages: List[tuple], angle: int, timer: StageTimer,
+                multiple: int = 16) -> Iterator[tuple]:
+        # Output blocks start on multiples of the strip height, counted from the output origin
+        width, height = reader.size
+        rows = self._rows(self._row_bytes(reader), multiple)
+        for y0, y1, strip in reader.windows(rows, from_bottom=angle in (180, 270)):
+            with timer.stage('transform'):
+                strip = self._apply_stages(strip, stages)
+                if angle:
+                    strip = strip.transpose(ImageProcessor.TRANSPOSE_ROTATIONS[angle])
+            yield {0: (0, y0), 90: (y0, 0), 180: (0, height - y1), 270: (height - y1, 0)}[angle] + (strip,)
+
+    def _row_bands(self, reader: StripReader, stages: List[tuple], angle: int,
+                   timer: StageTimer) -> Iterator[Image.Image]:
+        # Row-sequential output of a 90/270 rotation needs input columns: one input pass per band
+        width, height = reader.size
+        input_rows = self._rows(self._row_bytes(reader), share=6)
+        band_rows = self._rows(height * len(reader.img.getbands()), share=2)
+        if width > band_rows:
+            reader.random_access(input_rows)
+        for b0 in range(0, width, band_rows):
+            b1 = min(width, b0 + band_rows)
+            band = Image.new(reader.img.mode, (height, b1 - b0))
+            columns = (width - b1, width - b0) if angle == 90 else (b0, b1)
+            for y0, y1, strip in reader.windows(input_rows):
+                with timer.stage('transform'):
+                    piece = self._apply_stages(strip.crop((columns[0], 0, columns[1], strip.height)), stages)
+                    piece = piece.transpose(ImageProcessor.TRANSPOSE_ROTATIONS[angle])
+                    band.paste(piece, (y0 if angle == 90 else height - y1, 0))
+            yield band
+
+    def _downscale(self, reader: StripReader, pre: List[Dict], resize: Dict, timer: StageTimer) -> Image.Image:
+        # Integer box reduction per strip is seamless when strips are multiples of the factor;
+        # the final resample then runs on a frame only ~2x the target
+        width, height = reader.size
+        factor = max(1, min(width // (2 * resize['width']), height // (2 * resize['height'])))
+        stages = self._resolve_stages(reader, self._enhancements(pre))
+        # Stay premultiplied until the end, as a single Pillow resize would
+        mode = reader.img.mode
+        working_mode = {'RGBA': 'RGBa', 'LA': 'La'}.get(mode, mode)
+        canvas = Image.new(working_mode, (math.ceil(width / factor), math.ceil(height / factor)))
+        for y0, y1, strip in reader.windows(self._rows(self._row_bytes(reader), factor)):
+            with timer.stage('transform'):
+                strip = self._apply_stages(strip, stages).convert(working_mode)
+                canvas.paste(strip.reduce(factor), (0, y0 // factor))
+        timer.track_image(canvas)
+        with timer.stage('transform'):
+            # A drafted JPEG frame is rounded up; its box holds the extent of the original image
+            source_width, source_height = resize['box'][2:] if resize.get('box') else (width, height)
+            box = (0, 0, source_width / factor, source_height / factor)
+            return canvas.resize((resize['width'], resize['height']), box=box).convert(mode)
+
+    @staticmethod
+    def _enhancements(plan: List[Dict]) -> List[Dict]:
+        return [stage for step in plan if step['operation'] == 'enhance' for stage in step['stages']]
+
+    def _resolve_stages(self, reader: StripReader, enhancements: List[Dict]) -> List[tuple]:
+        # Each run of point-wise stages becomes one table; contrast costs one extra histogram pass over the strips
+        stages = []
+        for group in EnhancementEngine.groups(enhancements):
+            if group[0]['enhancement_type'] not in EnhancementEngine.LUT_TYPES:
+                stages.extend(('stage', stage) for stage in group)
+                continue
+            histogram = None
+            if EnhancementEngine.needs_histogram(group):
+                histogram = [0] * (256 * len(reader.img.getbands()))
+                for _, _, strip in reader.windows(self._rows(self._row_bytes(reader))):
+                    for index, count in enumerate(self._apply_stages(strip, stages).histogram()):
+                        histogram[index] += count
+            stages.append(('lut', EnhancementEngine.compile(group, reader.img.mode, histogram)))
+        return stages
+
+    @staticmethod
+    def _apply_stages(strip: Image.Image, stages: List[tuple]) -> Image.Image:
+        for kind, value in stages:
+            strip = strip.point(value) if kind == 'lut' else EnhancementEngine.apply_single(strip, value)
+        return strip
+
+# Per-process state for batch workers; history is recorded by the parent process
+_worker_processor: Optional[ImageProcessor] = None
+
+def _init_batch_worker(cache_dir: Optional[str] = None, cache_max_bytes: Optional[int] = None,
+                       profile_hook: Optional[ProfileHook] = None, tile_budget: Optional[int] = None,
+                       allow_large_images: bool = False):
+    global _worker_processor
+    # Forked workers inherit the parent's handlers. The parent drains on Ctrl+C, and the pool must
+    # still be able to terminate a worker when it tears down a broken pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Register every format plugin now rather than on the first job
+    Image.init()
+    cache = ResultCache(cache_dir, cache_max_bytes) if cache_dir else None
+    _worker_processor = ImageProcessor(history_file=None, cache=cache, tile_budget=tile_budget,
+                                       allow_large_images=allow_large_images)
+    if profile_hook:
+        profile_hook.install()
+
+def _process_batch_item(input_path: str, operation: str, params: Dict) -> Dict:
+    result = {'input': input_path, 'output': None, 'outputs': [], 'error': None,
+              'bytes_in': 0, 'bytes_out': 0, 'elapsed': 0.0}
+    timer = StageTimer()
+    start = time.perf_counter()
+    try:
+        result['output'] = _worker_processor._execute(input_path, operation, params, timer)
+        result['outputs'] = [result['output']]
+        if operation == 'renditions':
+            # The manifest names every image this job wrote
+            directory = os.path.dirname(result['output'])
+            with open(result['output'], 'r') as f:
+                result['outputs'] += [os.path.join(directory, entry['path'])
+                                      for entry in json.load(f)['renditions']]
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['elapsed'] = time.perf_counter() - start
+    result['bytes_in'], result['bytes_out'] = timer.bytes_read, timer.bytes_written
+    result.update(timer.as_dict())
+    return result
+
+class MemoryScheduler:
+    # Decoded frames held at once per operation: resize/rotate keep input and output,
+    # enhancements add a degenerate frame or a filter temporary on top
+    OPERATION_FRAMES = {
+        'convert': 1.0,
+        'resize': 2.0,
+        'rotate': 2.0,
+        'flip': 2.0,
+        'orient': 2.0,
+        'enhance': 3.0,
+        'renditions': 2.0,
+    }
+    # After this many admission rounds in which a newer job went ahead of it, a job stops everything
+    # else from being admitted, so memory drains for it instead of it starving behind a stream of thumbnails
+    MAX_SKIPS = 8
+
+    def __init__(self, budget: int, max_queued: int = 256):
+        self.budget = budget
+        self.max_queued = max(1, max_queued)
+        self.queue: List[list] = []  # [estimate, sequence, skips, deferred, item], smallest first
+        self.sequence = 0
+        self.in_flight_bytes = 0
+        self.metrics = {'queue_depth': 0, 'max_queue_depth': 0, 'admitted': 0, 'admitted_bytes': 0,
+                        'in_flight_bytes': 0, 'peak_in_flight_bytes': 0, 'deferred': 0, 'stalls': 0,
+                        'oversized': 0}
+
+    @classmethod
+    def estimate(cls, path: str, operation: str, params: Dict) -> int:
+        try:
+            info = FileExplorer.probe(path)
+        except Exception:
+            # Unreadable inputs fail fast in the worker; they hold no frame
+            return 0
+        mode = info['mode']
+        bytes_per_pixel = 1 if mode in ('1', 'L', 'P') else 2 if mode.startswith('I;16') else 4
+        frame = info['width'] * info['height'] * bytes_per_pixel
+        if operation == 'pipeline':
+            frames = max([cls.OPERATION_FRAMES.get(step.get('operation'), 1.0) for step in params['steps']] or [1.0])
+        else:
+            frames = cls.OPERATION_FRAMES.get(operation, 1.0)
+        return int(frame * frames)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.queue)
+
+    def full(self) -> bool:
+        return len(self.queue) >= self.max_queued
+
+    def add(self, item, estimate: int):
+        bisect.insort(self.queue, [estimate, self.sequence, 0, False, item])
+        self.sequence += 1
+        self._update_depth()
+
+    def admit(self, slots: int) -> List[tuple]:
+        # Smallest first; the oldest job passed over MAX_SKIPS times blocks everything else until it fits
+        admitted = []
+        starving = min((entry for entry in self.queue if entry[2] >= self.MAX_SKIPS),
+                       key=lambda entry: entry[1], default=None)
+        for entry in [starving] if starving else list(self.queue):
+            if len(admitted) >= slots:
+                break
+            if self.in_flight_bytes + entry[0] > self.budget:
+                if self.in_flight_bytes:
+                    # Sorted by size, so nothing behind this one fits either: with slots still free,
+                    # every queued job is waiting on memory. Each job is counted once however long it waits
+                    self.metrics['stalls'] += 1
+                    for waiting in self.queue:
+                        if not waiting[3]:
+                            waiting[3] = True
+                            self.metrics['deferred'] += 1
+                    break
+                # Larger than the whole budget: it runs, but alone
+                self.metrics['oversized'] += 1
+            self.queue.remove(entry)
+            self.in_flight_bytes += entry[0]
+            self.metrics['admitted'] += 1
+            self.metrics['admitted_bytes'] += entry[0]
+            admitted.append(entry)
+        if admitted:
+            # Whether memory or slots held them back, older jobs still queued were passed over this round
+            newest = max(entry[1] for entry in admitted)
+            for waiting in self.queue:
+                if waiting[1] < newest:
+                    waiting[2] += 1
+        self._update_depth()
+        return [(entry[4], entry[0]) for entry in admitted]
+
+    def release(self, estimate: int):
+        self.in_flight_bytes -= estimate
+        self.metrics['in_flight_bytes'] = self.in_flight_bytes
+
+    def _update_depth(self):
+        self.metrics['queue_depth'] = len(self.queue)
+        self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], len(self.queue))
+        self.metrics['in_flight_bytes'] = self.in_flight_bytes
+        self.metrics['peak_in_flight_bytes'] = max(self.metrics['peak_in_flight_bytes'], self.in_flight_bytes)
+
+class BatchProcessor:
+    def __init__(self, processor: ImageProcessor, workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, timing_log: Optional[str] = None,
+                 profile_hook: Optional[ProfileHook] = None, memory_budget: Optional[int] = None):
+        self.processor = processor
+        self.timing_log = timing_log
+        self.profile_hook = profile_hook
+        # Estimated decoded bytes allowed in flight across all workers; None admits by count only
+        self.memory_budget = memory_budget
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # Bounded submission keeps memory flat no matter how many files the source yields
+        self.max_in_flight = max(1, max_in_flight or self.workers * 2)
+
+    def iter_sources(self, source: str, where: Optional[List[tuple]] = None) -> Iterator[str]:
+        paths = self._iter_paths(source)
+        if not where:
+            yield from paths
+            return
+        # Outputs land next to inputs, so each directory's index is refreshed once, not per file
+        explorer = FileExplorer()
+        directory, index = None, None
+        for path in paths:
+            if os.path.dirname(os.path.abspath(path)) != directory:
+                directory = os.path.dirname(os.path.abspath(path))
+                index = explorer.get_image_index(directory)
+            entry = index.get(os.path.basename(path))
+            if entry and ImageIndex.matches(entry, where):
+                yield path
+
+    def _iter_paths(self, source: str) -> Iterator[str]:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if self._is_source(name):
+                        yield os.path.join(root, name)
+        else:
+            for path in glob.iglob(source, recursive=True):
+                if os.path.isfile(path) and self._is_source(path):
+                    yield path
+
+    def _is_source(self, path: str) -> bool:
+        return (os.path.splitext(path)[1].lower() in self.processor.supported_formats
+                and not self.processor.is_output(path))
+
+    # Marker lines are finished inputs; files a job wrote are prefixed so later walks skip them
+    OUTPUT_PREFIX = 'output:'
+
+    @classmethod
+    def load_resume_marker(cls, resume_file: Optional[str]) -> tuple[Set[str], Set[str]]:
+        completed, produced = set(), set()
+        if not resume_file or not os.path.exists(resume_file):
+            return completed, produced
+        with open(resume_file, 'r') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line.startswith(cls.OUTPUT_PREFIX):
+                    produced.add(line[len(cls.OUTPUT_PREFIX):])
+                elif line:
+                    completed.add(line)
+        return completed, produced
+
+    def run(self, source: str, operation: str, params: Dict,
+            resume_file: Optional[str] = None,
+            on_result: Optional[Callable[[Dict], None]] = None,
+            where: Optional[List[tuple]] = None) -> Dict:
+        if operation not in self.processor.OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+
+        completed, produced = self.load_resume_marker(resume_file)
+        stats = {'succeeded': 0, 'failed': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0,
+                 'peak_image_bytes': 0, 'stages': {}}
+        scheduler = MemoryScheduler(self.memory_budget, max(self.max_in_flight, 256)) if self.memory_budget else None
+        marker = open(resume_file, 'a') if resume_file else None
+        timing_log = open(self.timing_log, 'a') if self.timing_log else None
+        start = time.perf_counter()
+
+        def handle(result: Dict):
+            if result['error'] is None:
+                stats['succeeded'] += 1
+                stats['bytes_in'] += result['bytes_in']
+                stats['bytes_out'] += result['bytes_out']
+                history_start = time.perf_counter()
+                self.processor._record_operation(result['input'], result['output'], operation, params)
+                result['stages']['history'] = time.perf_counter() - history_start
+                outputs = [os.path.abspath(path) for path in result['outputs']]
+                produced.update(outputs)
+                if marker:
+                    marker.write(''.join(f"{self.OUTPUT_PREFIX}{path}\n" for path in outputs)
+                                 + os.path.abspath(result['input']) + '\n')
+                    marker.flush()
+            else:
+                stats['failed'] += 1
+                logging.error(f"Batch processing error for {result['input']}: {result['error']}")
+            stats['peak_image_bytes'] = max(stats['peak_image_bytes'], result['peak_image_bytes'])
+            for name, seconds in result['stages'].items():
+                stats['stages'][name] = stats['stages'].get(name, 0.0) + seconds
+            if timing_log:
+                extra = {'queue_depth': scheduler.queue_depth,
+                         'in_flight_bytes': scheduler.in_flight_bytes} if scheduler else {}
+                timing_log.write(json.dumps(dict(result, timestamp=datetime.now().isoformat(),
+                                                 operation=operation, **extra)) + '\n')
+            if on_result:
+                on_result(result)
+
+        try:
+            cache = self.processor.cache
+            initargs = (((cache.cache_dir, cache.max_bytes) if cache else (None, None))
+                        + (self.profile_hook, self.processor.tile_budget, self.processor.allow_large_images))
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_batch_worker,
+                                     initargs=initargs) as pool:
+                pending: Dict[Future, int] = {}  # future -> admitted memory estimate
+
+                def collect():
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        estimate = pending.pop(future)
+                        if scheduler:
+                            scheduler.release(estimate)
+                        handle(dict(future.result(), estimated_bytes=estimate))
+
+                def dispatch():
+                    for path, estimate in scheduler.admit(self.max_in_flight - len(pending)):
+                        pending[pool.submit(_process_batch_item, path, operation, params)] = estimate
+
+                for path in self.iter_sources(source, where):
+                    if os.path.abspath(path) in produced:
+                        # Written by this batch (or the run being resumed), not a source
+                        continue
+                    if os.path.abspath(path) in completed:
+                        stats['skipped'] += 1
+                        continue
+                    if scheduler:
+                        scheduler.add(path, scheduler.estimate(path, operation, params))
+                        dispatch()
+                        # Backpressure: the source isn't read further while the queue is full
+                        while scheduler.full():
+                            collect()
+                            dispatch()
+                        continue
+                    if len(pending) >= self.max_in_flight:
+                        collect()
+                    pending[pool.submit(_process_batch_item, path, operation, params)] = 0
+                while scheduler and scheduler.queue_depth:
+                    collect()
+                    dispatch()
+                while pending:
+                    collect()
+        finally:
+            self.processor.save_history()
+            if marker:
+                marker.close()
+            if timing_log:
+                timing_log.close()
+            if self.profile_hook:
+                self.profile_hook.merge()
+
+        elapsed = time.perf_counter() - start
+        stats['elapsed'] = elapsed
+        if scheduler:
+            stats['scheduler'] = dict(scheduler.metrics)
+        stats['images_per_sec'] = stats['succeeded'] / elapsed if elapsed else 0.0
+        stats['mb_per_sec'] = stats['bytes_in'] / (1024 * 1024) / elapsed if elapsed else 0.0
+        return stats
+
+def _warm_worker() -> int:
+    return os.getpid()
+
+class JobServer:
+    TERMINAL = ('done', 'failed')
+
+    def __init__(self, processor: ImageProcessor, requests_file: Optional[str] = 'cc_requests.jsonl',
+                 inbox: Optional[str] = None, outbox: str = 'cc_outbox.jsonl', workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, poll_interval: float = 0.02):
+        self.processor = processor
+        self.requests_file = requests_file
+        self.offset_file = f"{requests_file}.offset" if requests_file else None
+        self.inbox = inbox
+        self.processed_dir = os.path.join(inbox, 'processed') if inbox else None
+        self.outbox_path = outbox
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_in_flight = max(1, max_in_flight or self.workers * 2)
+        self.poll_interval = poll_interval
+        self.stats = {'received': 0, 'succeeded': 0, 'failed': 0, 'duplicates': 0}
+        self.finished: Set[str] = set()
+        self.running: Set[str] = set()
+        self.claimed: Set[str] = set()
+        # Request lines are acknowledged in file order, once their result is durable in the outbox
+        self.tickets: deque = deque()
+        self.offset = 0
+        self.read_offset = 0
+        self.outbox = None
+        self._stopping = False
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def load_state(self):
+        if os.path.exists(self.outbox_path):
+            with open(self.outbox_path, 'rb') as f:
+                data = f.read()
+            for line in data.splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('status') in self.TERMINAL:
+                    self.finished.add(record['job_id'])
+            if data and not data.endswith(b'\n'):
+                # A torn last line from a crash must not swallow the next record
+                with open(self.outbox_path, 'ab') as f:
+                    f.write(b'\n')
+        if self.offset_file and os.path.exists(self.offset_file):
+            with open(self.offset_file, 'r') as f:
+                self.offset = int(f.read().strip() or 0)
+        self.read_offset = self.offset
+        if self.processed_dir:
+            os.makedirs(self.processed_dir, exist_ok=True)
+
+    def parse_job(self, raw: bytes) -> Dict:
+        job = {'job_id': hashlib.sha256(raw.strip()).hexdigest()[:16], 'received': time.perf_counter()}
+        try:
+            request = json.loads(raw)
+            if not isinstance(request, dict):
+                raise ValueError("job must be a JSON object")
+            job['job_id'] = str(request.get('job_id') or job['job_id'])
+            job['input'] = request.get('input')
+            job['operation'] = request.get('operation')
+            params = request.get('params') or {}
+            if not isinstance(params, dict):
+                raise ValueError("params must be a JSON object")
+            job['params'] = dict(params)
+            if 'steps' in request:
+                job['params']['steps'] = request['steps']
+            if job['operation'] not in ImageProcessor.OPERATIONS:
+                raise ValueError(f"Unknown operation: {job['operation']}")
+            steps = job['params'].get('steps')
+            if job['operation'] == 'pipeline' and not (
+                    isinstance(steps, list) and all(isinstance(step, dict) for step in steps)):
+                raise ValueError("steps must be a list of JSON objects")
+            if not isinstance(job['input'], str) or not os.path.isfile(job['input']):
+                raise ValueError(f"Input not found: {job['input']}")
+        except Exception as e:
+            # A malformed line becomes a failed record; raising would stall the request offset on it
+            job['error'] = f"{type(e).__name__}: {e}"
+        return job
+
+    def collect(self, limit: int) -> List[Dict]:
+        jobs = []
+        if self.requests_file and os.path.exists(self.requests_file):
+            with open(self.requests_file, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < self.read_offset:
+                    logging.error(f"Request file {self.requests_file} shrank; reading it from the start")
+                    self.read_offset = self.offset = 0
+                    self.tickets.clear()
+                f.seek(self.read_offset)
+                while len(jobs) < limit:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        # The submitter has not finished writing this line yet
+                        break
+                    self.read_offset += len(line)
+                    if line.strip():
+                        job = self.parse_job(line)
+                        job['ticket'] = [self.read_offset, False]
+                        self.tickets.append(job['ticket'])
+                        jobs.append(job)
+        if self.inbox and len(jobs) < limit and os.path.isdir(self.inbox):
+            # Submitters write under another name and rename into place, so *.json files are complete
+            names = sorted(entry.name for entry in os.scandir(self.inbox)
+                           if entry.is_file() and entry.name.endswith('.json'))
+            for name in names:
+                path = os.path.join(self.inbox, name)
+                if path in self.claimed:
+                    continue
+                if len(jobs) >= limit:
+                    break
+                try:
+                    with open(path, 'rb') as f:
+                        job = self.parse_job(f.read())
+                except OSError as e:
+                    logging.error(f"Could not read job file {path}: {e}")
+                    continue
+                job['inbox_path'] = path
+                self.claimed.add(path)
+                jobs.append(job)
+        self.stats['received'] += len(jobs)
+        return jobs
+
+    def emit(self, record: Dict):
+        self.outbox.write(json.dumps(dict(record, timestamp=datetime.now().isoformat())) + '\n')
+
+    def finish(self, job: Dict, result: Dict):
+        self.running.discard(job['job_id'])
+        self.finished.add(job['job_id'])
+        record = {'job_id': job['job_id'], 'status': 'done' if result['error'] is None else 'failed',
+                  'input': job.get('input'), 'operation': job.get('operation'),
+                  'output': result['output'], 'error': result['error'],
+                  'elapsed': result['elapsed'], 'latency': time.perf_counter() - job['received']}
+        if 'stages' in result:
+            record['stages'] = result['stages']
+        if result['error'] is None:
+            self.stats['succeeded'] += 1
+            self.processor._record_operation(job['input'], result['output'], job['operation'], job['params'])
+        else:
+            self.stats['failed'] += 1
+            logging.error(f"Job {job['job_id']} failed: {result['error']}")
+        self.emit(record)
+        return record
+
+    def acknowledge(self, jobs: List[Dict]):
+        # Results hit the disk before their sources are released, so a crash only ever repeats work
+        self.outbox.flush()
+        os.fsync(self.outbox.fileno())
+        for job in jobs:
+            if 'ticket' in job:
+                job['ticket'][1] = True
+            elif 'inbox_path' in job:
+                try:
+                    os.replace(job['inbox_path'],
+                               os.path.join(self.processed_dir, os.path.basename(job['inbox_path'])))
+                except OSError as e:
+                    logging.error(f"Could not move job file {job['inbox_path']}: {e}")
+                self.claimed.discard(job['inbox_path'])
+        offset = self.offset
+        while self.tickets and self.tickets[0][1]:
+            offset = self.tickets.popleft()[0]
+        if offset != self.offset and self.offset_file:
+            temp_path = f"{self.offset_file}.tmp"
+            with open(temp_path, 'w') as f:
+                f.write(str(offset))
+            os.replace(temp_path, self.offset_file)
+        self.offset = offset
+
+    def start_pool(self, initargs: tuple) -> ProcessPoolExecutor:
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_batch_worker, initargs=initargs)
+        # Start every worker up front so the first jobs don't pay for interpreter and plugin startup
+        wait([pool.submit(_warm_worker) for _ in range(self.workers)])
+        return pool
+
+    def serve(self, once: bool = False, on_result: Optional[Callable[[Dict], None]] = None) -> Dict:
+        self.load_state()
+        cache = self.processor.cache
+        initargs = (((cache.cache_dir, cache.max_bytes) if cache else (None, None))
+                    + (None, self.processor.tile_budget, self.processor.allow_large_images))
+        self.outbox = open(self.outbox_path, 'a')
+        active: Dict[Future, Dict] = {}
+        settled: List[Dict] = []
+        pool = None
+
+        def settle(job: Dict, result: Dict):
+            record = self.finish(job, result)
+            settled.append(job)
+            if on_result:
+                on_result(record)
+
+        def restart(broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+            # A dead worker (an OOM kill, typically) breaks the whole pool. Which job it was running
+            # can't be told apart from the rest, so every job still on the pool fails rather than
+            # being retried into the next pool, where it would take that one down too
+            logging.error(f"A worker process died; failing {len(active)} in-flight jobs and restarting the pool")
+            for future, job in active.items():
+                if future.done() and future.exception() is None:
+                    settle(job, future.result())
+                else:
+                    settle(job, {'output': None, 'elapsed': 0.0,
+                                 'error': 'BrokenProcessPool: the worker process died while running this job'})
+            active.clear()
+            broken.shutdown(wait=True)
+            return self.start_pool(initargs)
+
+        try:
+            pool = self.start_pool(initargs)
+            while True:
+                jobs = [] if self._stopping else self.collect(self.max_in_flight - len(active))
+                for job in jobs:
+                    if job['job_id'] in self.finished or job['job_id'] in self.running:
+                        self.stats['duplicates'] += 1
+                        settled.append(job)
+                    elif 'error' in job:
+                        settle(job, {'output': None, 'error': job['error'], 'elapsed': 0.0})
+                    else:
+                        self.running.add(job['job_id'])
+                        self.emit({'job_id': job['job_id'], 'status': 'running', 'input': job['input'],
+                                   'operation': job['operation']})
+                        try:
+                            future = pool.submit(_process_batch_item, job['input'], job['operation'], job['params'])
+                        except BrokenProcessPool:
+                            # Broke since the last wait; this job never reached it and goes to the new pool
+                            pool = restart(pool)
+                            future = pool.submit(_process_batch_item, job['input'], job['operation'], job['params'])
+                        active[future] = job
+                if active:
+                    done, _ = wait(active, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                        pool = restart(pool)
+                    else:
+                        for future in done:
+                            settle(active.pop(future), future.result())
+                if settled or jobs:
+                    self.acknowledge(settled)
+                    settled.clear()
+                if not active and not jobs:
+                    if self._stopping or once:
+                        break
+                    time.sleep(self.poll_interval)
+        finally:
+            if pool:
+                pool.shutdown(wait=True)
+            self.outbox.close()
+            self.processor.save_history()
+        return self.stats
 
 class FileExplorer:
-    def __init__(self):
+    SORT_KEYS = ('name', 'size', 'modified', 'type')
+
+    def __init__(self, page_size: int = 40, max_cached_directories: int = 32):
         self.current_path = os.path.abspath(os.getcwd())
-        self.supported_formats = {'.jpg', '.jpeg', '.png', '.webp'}
+        self.supported_formats = {'.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff'}
+        self.page_size = page_size
+        self.max_cached_directories = max_cached_directories
+        self._listings: Dict[str, Dict] = {}
+        self._indexes: Dict[str, 'ImageIndex'] = {}
+
+    def _listing(self, path: Optional[str] = None) -> Dict:
+        # One scandir per directory change; d_type answers is_dir/is_file without extra stat calls
+        path = path or self.current_path
+        mtime_ns = os.stat(path).st_mtime_ns
+        listing = self._listings.pop(path, None)
+        if listing is None or listing['mtime_ns'] != mtime_ns:
+            folders, files = [], []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            folders.append(entry)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in self.supported_formats:
+                            files.append(entry)
+                    except OSError:
+                        continue
+            folders.sort(key=lambda e: e.name)
+            files.sort(key=lambda e: e.name)
+            listing = {'mtime_ns': mtime_ns, 'folders': folders, 'files': files,
+                       'entries': {e.name: e for e in files}, 'views': {}}
+        self._listings[path] = listing  # Re-inserted last so eviction drops the least recent
+        while len(self._listings) > self.max_cached_directories:
+            self._listings.pop(next(iter(self._listings)))
+        return listing
 
     def get_directory_content(self) -> tuple[list, list]:
         try:
-            items = sorted(os.listdir(self.current_path))
-            folders = [d for d in items if os.path.isdir(os.path.join(self.current_path, d))]
-            files = [f for f in items if os.path.isfile(os.path.join(self.current_path, f)) 
-                    and os.path.splitext(f)[1].lower() in self.supported_formats]
-            return folders, files
+            listing = self._listing()
+            return [e.name for e in listing['folders']], [e.name for e in listing['files']]
         except Exception as e:
             logging.error(f"Error reading directory: {e}")
             return [], []
 
+    def list_page(self, page: int = 0, page_size: Optional[int] = None, sort: str = 'name',
+                  reverse: bool = False, pattern: Optional[str] = None,
+                  where: Optional[List[tuple]] = None) -> Dict:
+        page_size = page_size or self.page_size
+        try:
+            listing = self._listing()
+        except Exception as e:
+            logging.error(f"Error reading directory: {e}")
+            return {'folders': [], 'files': [], 'page': 0, 'pages': 1, 'total': 0}
+
+        # Sorted/filtered views are cached with the listing, so paging is O(page size)
+        view_key = (sort, reverse, pattern, tuple(where or ()))
+        files = listing['views'].get(view_key)
+        if files is None:
+            files = listing['files']
+            if pattern:
+                files = [e for e in files if fnmatch.fnmatch(e.name.lower(), pattern.lower())]
+            if where:
+                matching = {entry['name'] for entry in self.get_image_index().query(where)}
+                files = [e for e in files if e.name in matching]
+            if sort != 'name' or reverse:
+                files = sorted(files, key=self._sort_key(sort), reverse=reverse)
+            listing['views'][view_key] = files
+
+        folders = listing['folders']
+        total = len(folders) + len(files)
+        pages = max(1, math.ceil(total / page_size))
+        page = min(max(page, 0), pages - 1)
+        start, end = page * page_size, (page + 1) * page_size
+        return {
+            'folders': [e.name for e in folders[start:end]],
+            'files': [e.name for e in files[max(0, start - len(folders)):max(0, end - len(folders))]],
+            'page': page,
+            'pages': pages,
+            'total': total,
+        }
+
+    @staticmethod
+    def _sort_key(sort: str) -> Callable:
+        def stat_value(entry: os.DirEntry, attribute: str):
+            try:
+                return getattr(entry.stat(), attribute)
+            except OSError:
+                return 0
+
+        if sort == 'size':
+            return lambda e: stat_value(e, 'st_size')
+        if sort == 'modified':
+            return lambda e: stat_value(e, 'st_mtime')
+        if sort == 'type':
+            return lambda e: (os.path.splitext(e.name)[1].lower(), e.name)
+        return lambda e: e.name
+
+    @staticmethod
+    def probe(path: str) -> Dict:
+        # Header-only: Image.open reads just enough to know size/mode, load() is never called
+        with Image.open(path) as img:
+            orientation = 1
+            # getexif() reads TIFF tags and JPEG/WebP headers as they are; a PNG's would decode the
+            # pixels to look for an eXIf chunk after them, so there only a header one counts
+            if img.format != 'PNG' or 'exif' in img.info:
+                orientation = img.getexif().get(0x0112, 1)
+            return {
+                'width': img.width,
+                'height': img.height,
+                'mode': img.mode,
+                'format': img.format,
+                'orientation': orientation,
+            }
+
+    def get_image_index(self, path: Optional[str] = None) -> 'ImageIndex':
+        path = os.path.abspath(path or self.current_path)
+        index = self._indexes.pop(path, None) or ImageIndex(path, self)
+        self._indexes[path] = index
+        while len(self._indexes) > self.max_cached_directories:
+            self._indexes.pop(next(iter(self._indexes))).save()
+        return index.refresh()
+
     def navigate(self, selection: str) -> bool:
         try:
             if selection == '..':
@@ -137,8 +2420,11 @@ class FileExplorer:
 
     def get_file_info(self, filename: str) -> Dict:
         path = os.path.join(self.current_path, filename)
+        listing = self._listings.get(self.current_path)
+        entry = listing['entries'].get(filename) if listing else None
         try:
-            stats = os.stat(path)
+            # DirEntry caches its stat result, so repeated redraws cost nothing
+            stats = entry.stat() if entry else os.stat(path)
             return {
                 'size': self.format_size(stats.st_size),
                 'modified': datetime.fromtimestamp(stats.st_mtime).strftime('%Y-%m-%d %H:%M'),
@@ -156,6 +2442,126 @@ class FileExplorer:
             size /= 1024
         return f"{size:.1f}TB"
 
+class ImageIndex:
+    FILENAME = '.cc_index.json'
+    # 2: TIFF orientation is read from its tags
+    VERSION = 2
+    FILTER_PATTERN = re.compile(r'^(\w+)(>=|<=|!=|=|>|<)(.+)$')
+    FIELDS = ('name', 'width', 'height', 'pixels', 'mode', 'format', 'orientation', 'size')
+
+    def __init__(self, directory: str, explorer: FileExplorer):
+        self.directory = directory
+        self.explorer = explorer
+        self.path = os.path.join(directory, self.FILENAME)
+        self.entries: Dict[str, Dict] = {}
+        self._listing_mtime = None
+        self._dirty = False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self.entries = data['entries']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Image index load failed for {self.directory}: {e}")
+
+    def refresh(self) -> 'ImageIndex':
+        listing = self.explorer._listing(self.directory)
+        if listing['mtime_ns'] == self._listing_mtime and not self._dirty:
+            return self
+        current = {}
+        for entry in listing['files']:
+            try:
+                stats = entry.stat()
+            except OSError:
+                continue
+            cached = self.entries.get(entry.name)
+            if cached and cached['size'] == stats.st_size and cached['mtime_ns'] == stats.st_mtime_ns:
+                current[entry.name] = cached
+                continue
+            # Only new or changed files pay for a probe
+            record = {'size': stats.st_size, 'mtime_ns': stats.st_mtime_ns}
+            try:
+                record.update(self.explorer.probe(entry.path))
+            except Exception as e:
+                record['error'] = str(e)
+            current[entry.name] = record
+            self._dirty = True
+        if len(current) != len(self.entries):
+            self._dirty = True
+        self.entries = current
+        self._listing_mtime = listing['mtime_ns']
+        self.save()
+        return self
+
+    def save(self):
+        if not self._dirty:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'version': self.VERSION, 'entries': self.entries}, f)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            # Read-only archives still get an in-memory index
+            logging.error(f"Image index save failed for {self.directory}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def get(self, name: str) -> Optional[Dict]:
+        entry = self.entries.get(name)
+        return dict(entry, name=name) if entry else None
+
+    def query(self, where: List[tuple]) -> List[Dict]:
+        return [dict(entry, name=name) for name, entry in sorted(self.entries.items())
+                if self.matches(dict(entry, name=name), where)]
+
+    @classmethod
+    def parse_filter(cls, expression: str) -> List[tuple]:
+        # "format=JPEG width>4000" -> [('format', '=', 'JPEG'), ('width', '>', 4000)]
+        filters = []
+        for token in expression.split():
+            match = cls.FILTER_PATTERN.match(token)
+            if not match or match.group(1).lower() not in cls.FIELDS:
+                raise ValueError(f"Invalid image filter: {token}")
+            field, operator, value = match.groups()
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+            filters.append((field.lower(), operator, value))
+        return filters
+
+    @staticmethod
+    def matches(entry: Dict, where: List[tuple]) -> bool:
+        if 'error' in entry:
+            return False
+        for field, operator, expected in where:
+            actual = entry['width'] * entry['height'] if field == 'pixels' else entry.get(field)
+            if isinstance(expected, str):
+                actual, expected = str(actual).lower(), expected.lower()
+            elif not isinstance(actual, (int, float)):
+                return False
+            if not {
+                '=': actual == expected,
+                '!=': actual != expected,
+                '>': actual > expected,
+                '>=': actual >= expected,
+                '<': actual < expected,
+                '<=': actual <= expected,
+            }[operator]:
+                return False
+        return True
+
+def configure_logging():
+    logging.basicConfig(
+        filename='crisiscore.log',
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
 class CrisisCoreCLI:
     def __init__(self):
         self.processor = ImageProcessor()
@@ -165,11 +2571,7 @@ class CrisisCoreCLI:
         self.current_operation = "BROWSING"
 
     def setup_logging(self):
-        logging.basicConfig(
-            filename='crisiscore.log',
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        configure_logging()
 
     def clear_screen(self):
         os.system('clear' if os.name != 'nt' else 'cls')
@@ -186,35 +2588,138 @@ class CrisisCoreCLI:
         print(f"║{CCTheme.RESET} 1. Browse Files               {CCTheme.PRIMARY}║")
         print(f"║{CCTheme.RESET} 2. Convert Format             {CCTheme.PRIMARY}║")
         print(f"║{CCTheme.RESET} 3. Resize Image               {CCTheme.PRIMARY}║")
-        print(f"║{CCTheme.RESET} 4. Rotate Image               {CCTheme.PRIMARY}║")
+        print(f"║{CCTheme.RESET} 4. Rotate / Flip Image        {CCTheme.PRIMARY}║")
         print(f"║{CCTheme.RESET} 5. Enhance Image              {CCTheme.PRIMARY}║")
         print(f"║{CCTheme.RESET} 6. View History               {CCTheme.PRIMARY}║")
         print(f"║{CCTheme.RESET} 7. Exit                       {CCTheme.PRIMARY}║")
         print(f"╚════════════════════════════════╝{CCTheme.RESET}")
 
-    def show_progress(self, operation: str):
+    def run_operation(self, input_path: str, operation: str, **kwargs) -> Optional[str]:
+        self.status = "PROCESSING"
         with tqdm(
-            total=100,
-            desc=CCTheme.secondary(f"Processing"),
-            bar_format='{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}',
+            total=len(StageTimer.STAGES),
+            desc=CCTheme.secondary("Processing"),
+            bar_format='{desc}: {percentage:3.0f}%|{bar}| {postfix}',
             colour='green'
         ) as pbar:
-            for _ in range(100):
-                time.sleep(0.01)
-                pbar.update(1)
+            seen = set()
+
+            def advance(stage: str):
+                # Tiled runs report each stage once per strip; the bar counts stages, not strips
+                pbar.set_postfix_str(stage)
+                if stage in StageTimer.STAGES and stage not in seen:
+                    seen.add(stage)
+                    pbar.update(1)
+
+            timer = StageTimer(on_stage=advance)
+            output_path = self.processor.process_image(input_path, operation, timer=timer, **kwargs)
+            pbar.update(pbar.total - pbar.n)
+        self.status = "READY"
+
+        if output_path:
+            print(f"\n{CCTheme.primary('Saved:')} {output_path}")
+            print(f"{CCTheme.secondary('Timing:')} {timer.summary()}")
+            print(f"{CCTheme.secondary('I/O:')} read {FileExplorer.format_size(timer.bytes_read)}, "
+                  f"wrote {FileExplorer.format_size(timer.bytes_written)}, "
+                  f"peak image {FileExplorer.format_size(timer.peak_image_bytes)}")
+        else:
+            print(f"\n{CCTheme.ERROR}Processing failed! Check crisiscore.log for details.{CCTheme.RESET}")
+        input("Press Enter to continue...")
+        return output_path
+
+    @staticmethod
+    def prompt_value(label: str, cast: Callable, choices: Optional[List[str]] = None):
+        while True:
+            value = input(f"{CCTheme.secondary(label)} ").strip()
+            try:
+                value = cast(value)
+                if choices is None or value in choices:
+                    return value
+            except ValueError:
+                pass
+            print(CCTheme.ERROR + "Invalid value!" + CCTheme.RESET)
+
+    def convert_format(self):
+        input_path = self.browse_files()
+        if input_path:
+            target = self.prompt_value("Target format (PNG/JPEG/WEBP/TIFF):", str.upper,
+                                       ['PNG', 'JPEG', 'WEBP', 'TIFF'])
+            self.run_operation(input_path, 'convert', format=target)
+
+    def resize_image(self):
+        input_path = self.browse_files()
+        if input_path:
+            width = self.prompt_value("Width:", int)
+            height = self.prompt_value("Height:", int)
+            self.run_operation(input_path, 'resize', width=width, height=height)
+
+    @staticmethod
+    def parse_rotation(value: str) -> Dict:
+        value = value.lower()
+        if value == 'auto':
+            return {'operation': 'orient'}
+        if value in ('h', 'v'):
+            return {'operation': 'flip', 'direction': 'horizontal' if value == 'h' else 'vertical'}
+        return {'operation': 'rotate', 'angle': float(value)}
+
+    def rotate_image(self):
+        input_path = self.browse_files()
+        if input_path:
+            params = self.prompt_value("Angle (degrees, counter-clockwise), h/v to flip, or auto (EXIF):",
+                                       self.parse_rotation)
+            operation = params.pop('operation')
+            if (os.path.splitext(input_path)[1].lower() in ('.jpg', '.jpeg')
+                    and (operation != 'rotate' or params['angle'] % 90 == 0)):
+                params['lossless'] = self.prompt_value("Lossless JPEG transform (y/n):", str.lower,
+                                                       ['y', 'n']) == 'y'
+            self.run_operation(input_path, operation, **params)
+
+    def enhance_image(self):
+        input_path = self.browse_files()
+        if input_path:
+            enhancement_type = self.prompt_value("Enhancement (" + '/'.join(EnhancementEngine.TYPES) + "):",
+                                                 str.lower, list(EnhancementEngine.TYPES))
+            if enhancement_type == 'levels':
+                black = self.prompt_value("Black point (0-255):", int, list(range(255)))
+                white = self.prompt_value("White point (0-255):", int, list(range(black + 1, 256)))
+                self.run_operation(input_path, 'enhance', enhancement_type=enhancement_type, black=black, white=white)
+            else:
+                factor = self.prompt_value("Factor (1.0 = unchanged):", float)
+                self.run_operation(input_path, 'enhance', enhancement_type=enhancement_type, factor=factor)
+
+    def view_history(self):
+        self.clear_screen()
+        self.print_header()
+        entries = self.processor.history.recent(20) if self.processor.history else []
+
+        print(f"\n{CCTheme.secondary('Recent Operations:')}")
+        if not entries:
+            print("No operations recorded yet.")
+        for entry in entries:
+            output = os.path.basename(entry['output']) if entry['output'] else '-'
+            print(f"{entry['timestamp'][:19]} {entry['operation']:10} "
+                  f"{os.path.basename(entry['input'] or '')[:30]:30} -> {output}")
+        input("\nPress Enter to continue...")
 
     def browse_files(self) -> Optional[str]:
+        page, sort_index, pattern, where, where_text = 0, 0, None, None, ''
         while True:
             self.clear_screen()
             self.print_header()
-            folders, files = self.explorer.get_directory_content()
+            sort = FileExplorer.SORT_KEYS[sort_index]
+            listing = self.explorer.list_page(page, sort=sort, pattern=pattern, where=where)
+            page = listing['page']
+            folders, files = listing['folders'], listing['files']
             
             print(f"\n{CCTheme.secondary('Current Location:')}")
             print(f"{CCTheme.PRIMARY}{self.explorer.current_path}{CCTheme.RESET}")
+            print(f"Page {page + 1}/{listing['pages']} ({listing['total']} items) | "
+                  f"Sort: {sort} | Filter: {pattern or 'none'} | Where: {where_text or 'none'}")
             
             print(f"\n{CCTheme.secondary('Navigation:')}")
             print("0. Return to Main Menu")
             print(".. Go Up")
+            print("n/p Next/Previous Page   s Change Sort   f Filter   w Image Filter")
             
             if folders:
                 print(f"\n{CCTheme.secondary('Folders:')}")
@@ -234,6 +2739,28 @@ class CrisisCoreCLI:
                 return None
             elif choice == '..':
                 self.explorer.navigate('..')
+                page = 0
+                continue
+            elif choice in ('n', 'p'):
+                page += 1 if choice == 'n' else -1
+                continue
+            elif choice == 's':
+                sort_index = (sort_index + 1) % len(FileExplorer.SORT_KEYS)
+                page = 0
+                continue
+            elif choice == 'f':
+                pattern = input("Filename filter (e.g. *.jpg, empty to clear): ").strip() or None
+                page = 0
+                continue
+            elif choice == 'w':
+                expression = input("Image filter (e.g. format=JPEG width>4000, empty to clear): ").strip()
+                try:
+                    where = ImageIndex.parse_filter(expression) or None
+                    where_text = expression
+                    page = 0
+                except ValueError as e:
+                    print(CCTheme.ERROR + str(e) + CCTheme.RESET)
+                    input("Press Enter to continue...")
                 continue
                 
             try:
@@ -241,6 +2768,7 @@ class CrisisCoreCLI:
                 if 1 <= index <= len(folders):
                     folder_name = folders[index-1]
                     self.explorer.navigate(folder_name)
+                    page = 0
                 elif len(folders) < index <= len(folders) + len(files):
                     file_name = files[index-len(folders)-1]
                     return os.path.join(self.explorer.current_path, file_name)
@@ -287,10 +2815,239 @@ class CrisisCoreCLI:
                 print(f"\n{CCTheme.ERROR}An error occurred! Check crisiscore.log for details.{CCTheme.RESET}")
                 input("Press Enter to continue...")
 
+def parse_step_spec(spec: str) -> Dict:
+    operation, _, arguments = spec.partition(':')
+    step = {'operation': operation.strip()}
+    for pair in filter(None, arguments.split(',')):
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Invalid step parameter: {pair}")
+        for cast in (int, float):
+            try:
+                value = cast(value)
+                break
+            except ValueError:
+                pass
+        step[key.strip().replace('-', '_')] = value
+    if step['operation'] not in ImageProcessor.STEP_OPERATIONS:
+        raise argparse.ArgumentTypeError(f"Unknown pipeline step: {step['operation']}")
+    return step
+
+def parse_int_list(value: str) -> List[int]:
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected comma-separated integers: {value}")
+
+def parse_image_filter(expression: str) -> List[tuple]:
+    try:
+        return ImageIndex.parse_filter(expression)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='CrisisCore Systems Image Processor')
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch = subparsers.add_parser('batch', help='Process a directory tree or glob without the interactive menu')
+    batch.add_argument('source', help='Directory (walked recursively) or glob pattern; earlier results are skipped')
+    batch.add_argument('operation', choices=ImageProcessor.OPERATIONS)
+    batch.add_argument('--format', help='Target format for convert (e.g. PNG, JPEG, WEBP)')
+    batch.add_argument('--width', type=int, help='Target width for resize')
+    batch.add_argument('--height', type=int, help='Target height for resize')
+    batch.add_argument('--tier', choices=list(ImageProcessor.RESIZE_TIERS),
+                       help='Resize quality/speed tier (default: full)')
+    batch.add_argument('--widths', type=parse_int_list, metavar='W,W,...',
+                       help='Rendition widths in pixels (e.g. 2048,1024,512,256)')
+    batch.add_argument('--formats', type=lambda value: value.upper().split(','), metavar='FMT,FMT,...',
+                       help='Rendition formats (' + ', '.join(ImageProcessor.RENDITION_FORMATS) + ')')
+    batch.add_argument('--quality', type=int, help='JPEG/WebP quality for renditions')
+    batch.add_argument('--angle', type=float, help='Rotation angle in degrees')
+    batch.add_argument('--direction', choices=list(ImageProcessor.FLIPS), help='Mirror direction for flip')
+    batch.add_argument('--lossless', action='store_true', default=None,
+                       help='Transform JPEGs in the DCT domain with jpegtran (rotate by 90/180/270, flip, orient)')
+    batch.add_argument('--enhancement-type', choices=list(EnhancementEngine.TYPES))
+    batch.add_argument('--factor', type=float, help='Enhancement factor (gamma for gamma)')
+    batch.add_argument('--black', type=int, help='Input black point for levels (0-255)')
+    batch.add_argument('--white', type=int, help='Input white point for levels (0-255)')
+    batch.add_argument('--step', dest='steps', action='append', type=parse_step_spec, metavar='OP:KEY=VALUE,...',
+                       help='Pipeline step, repeatable and applied in order (e.g. resize:width=800,height=600)')
+    batch.add_argument('--where', type=parse_image_filter, metavar='FILTER',
+                       help='Header filter, e.g. "format=JPEG width>4000" (fields: ' + ', '.join(ImageIndex.FIELDS) + ')')
+    batch.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    batch.add_argument('--max-in-flight', type=int, help='Maximum queued jobs (default: 2 x workers)')
+    batch.add_argument('--resume', metavar='FILE', help='Resume marker file listing finished inputs')
+    batch.add_argument('--cache-dir', metavar='DIR', help='Reuse results for unchanged inputs from this cache')
+    batch.add_argument('--cache-size', type=int, default=1024, metavar='MB', help='Cache size cap (default: 1024)')
+    batch.add_argument('--history-max-entries', type=int, default=ImageProcessor.HISTORY_MAX_ENTRIES, metavar='N',
+                       help=f"Keep only the newest N history entries (default: {ImageProcessor.HISTORY_MAX_ENTRIES})")
+    batch.add_argument('--history-max-age', type=float, metavar='DAYS', help='Drop history entries older than this')
+    batch.add_argument('--tile-budget', type=int, metavar='MB',
+                       help='Process decoded frames larger than this in strips (convert, point-wise enhance, '
+                            'right-angle rotate, downscale)')
+    batch.add_argument('--allow-large-images', action='store_true',
+                       help="Accept images past Pillow's pixel limit when --tile-budget can process them in strips")
+    batch.add_argument('--memory-budget', type=int, metavar='MB',
+                       help='Admit jobs, smallest first, while their estimated decoded size fits this budget')
+    batch.add_argument('--timing-log', metavar='FILE', help='Append per-image stage timings as JSON lines')
+    batch.add_argument('--profile', metavar='FILE', help='Write merged cProfile stats from all workers')
+    batch.add_argument('--tracemalloc', metavar='FILE', help='Append top allocation sites per worker')
+
+    serve = subparsers.add_parser('serve', help='Run as a job server fed by a JSON lines request file and/or an inbox')
+    serve.add_argument('--requests', default='cc_requests.jsonl', metavar='FILE',
+                       help='Append-only request file to tail, one JSON job per line (default: cc_requests.jsonl)')
+    serve.add_argument('--inbox', metavar='DIR',
+                       help='Directory watched for *.json job files (write elsewhere, then rename into place)')
+    serve.add_argument('--outbox', default='cc_outbox.jsonl', metavar='FILE',
+                       help='JSON lines status/result log (default: cc_outbox.jsonl)')
+    serve.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    serve.add_argument('--max-in-flight', type=int, help='Maximum dispatched jobs (default: 2 x workers)')
+    serve.add_argument('--poll-interval', type=float, default=0.02, metavar='SECONDS')
+    serve.add_argument('--once', action='store_true', help='Exit once all pending requests are processed')
+    serve.add_argument('--cache-dir', metavar='DIR', help='Reuse results for unchanged inputs from this cache')
+    serve.add_argument('--cache-size', type=int, default=1024, metavar='MB', help='Cache size cap (default: 1024)')
+    serve.add_argument('--history-max-entries', type=int, default=ImageProcessor.HISTORY_MAX_ENTRIES, metavar='N',
+                       help=f"Keep only the newest N history entries (default: {ImageProcessor.HISTORY_MAX_ENTRIES})")
+    serve.add_argument('--history-max-age', type=float, metavar='DAYS', help='Drop history entries older than this')
+    serve.add_argument('--tile-budget', type=int, metavar='MB',
+                       help='Process decoded frames larger than this in strips')
+    serve.add_argument('--allow-large-images', action='store_true',
+                       help="Accept images past Pillow's pixel limit when --tile-budget can process them in strips")
+
+    history = subparsers.add_parser('history', help='Query the operation history')
+    history.add_argument('--input', dest='input_path', help='Only entries for this input path')
+    history.add_argument('--operation', help='Only entries for this operation')
+    history.add_argument('--since', type=datetime.fromisoformat, help='ISO timestamp, inclusive')
+    history.add_argument('--until', type=datetime.fromisoformat, help='ISO timestamp, exclusive')
+    history.add_argument('--limit', type=int, default=100)
+    return parser
+
+def run_history(args: argparse.Namespace) -> int:
+    processor = ImageProcessor()
+    if processor.history is None:
+        print(CCTheme.ERROR + "History is unavailable. Check crisiscore.log for details." + CCTheme.RESET)
+        return 1
+    for entry in processor.history.query(args.input_path, args.operation, args.since, args.until, args.limit):
+        print(json.dumps(entry))
+    return 0
+
+def batch_params(parser: argparse.ArgumentParser, args: argparse.Namespace) -> Dict:
+    required = {
+        'convert': ['format'],
+        'resize': ['width', 'height'],
+        'rotate': ['angle'],
+        'flip': ['direction'],
+        'orient': [],
+        'enhance': ['enhancement_type'] + (['black', 'white'] if args.enhancement_type == 'levels' else ['factor']),
+        'pipeline': ['steps'],
+        'renditions': ['widths', 'formats'],
+    }[args.operation]
+    optional = {'resize': ['tier'], 'rotate': ['lossless'], 'flip': ['lossless'],
+                'orient': ['lossless'], 'renditions': ['tier', 'quality']}.get(args.operation, [])
+    missing = [name for name in required if getattr(args, name) is None]
+    if missing:
+        parser.error(f"{args.operation} requires " + ', '.join(
+            '--step' if m == 'steps' else '--' + m.replace('_', '-') for m in missing))
+    params = {name: getattr(args, name) for name in required}
+    params.update({name: getattr(args, name) for name in optional if getattr(args, name) is not None})
+    return params
+
+def run_batch(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    params = batch_params(parser, args)
+    cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    tile_budget = args.tile_budget * 1024 * 1024 if args.tile_budget else None
+    processor = ImageProcessor(cache=cache, tile_budget=tile_budget, history_max_entries=args.history_max_entries,
+                               history_max_age_days=args.history_max_age, allow_large_images=args.allow_large_images)
+    profile_hook = ProfileHook(args.profile, args.tracemalloc) if args.profile or args.tracemalloc else None
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    batch = BatchProcessor(processor, workers=args.workers, max_in_flight=args.max_in_flight,
+                           timing_log=args.timing_log, profile_hook=profile_hook, memory_budget=memory_budget)
+
+    # The bar advances only when a worker actually finishes an image
+    with tqdm(desc=CCTheme.secondary("Processing"), unit='img', colour='green') as pbar:
+        stage_totals: Dict[str, float] = {}
+
+        def report(result: Dict):
+            if result['error'] is None:
+                pbar.write(f"{CCTheme.primary('OK')}   {result['input']} -> {result['output']} ({result['elapsed']:.3f}s)")
+            else:
+                pbar.write(f"{CCTheme.ERROR}FAIL{CCTheme.RESET} {result['input']}: {result['error']}")
+            for name, seconds in result['stages'].items():
+                stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+            if stage_totals:
+                pbar.set_postfix_str(f"hot: {max(stage_totals, key=stage_totals.get)}", refresh=False)
+            pbar.update(1)
+
+        stats = batch.run(args.source, args.operation, params, resume_file=args.resume, on_result=report,
+                          where=args.where)
+    print(f"\n{CCTheme.secondary('Batch complete:')} "
+          f"{stats['succeeded']} succeeded, {stats['failed']} failed, {stats['skipped']} skipped "
+          f"in {stats['elapsed']:.2f}s "
+          f"({stats['images_per_sec']:.1f} images/s, {stats['mb_per_sec']:.2f} MB/s)")
+    total_stage_time = sum(stats['stages'].values())
+    if total_stage_time:
+        print(f"{CCTheme.secondary('Stage time:')} " + ', '.join(
+            f"{name} {seconds:.2f}s ({seconds / total_stage_time:.0%})" for name, seconds in stats['stages'].items()))
+        print(f"{CCTheme.secondary('Peak image memory:')} {FileExplorer.format_size(stats['peak_image_bytes'])}")
+    if 'scheduler' in stats:
+        metrics = stats['scheduler']
+        print(f"{CCTheme.secondary('Scheduler:')} {metrics['admitted']} admitted "
+              f"({FileExplorer.format_size(metrics['admitted_bytes'])} estimated), "
+              f"peak in flight {FileExplorer.format_size(metrics['peak_in_flight_bytes'])}, "
+              f"max queue {metrics['max_queue_depth']}, {metrics['deferred']} jobs deferred for memory "
+              f"({metrics['stalls']} admission stalls), "
+              f"{metrics['oversized']} oversized")
+    if cache:
+        cache_stats = cache.stats()
+        print(f"{CCTheme.secondary('Cache:')} {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{cache_stats['evictions']} evictions, {cache_stats['entries']} entries "
+              f"({FileExplorer.format_size(cache_stats['bytes'])})")
+    return 1 if stats['failed'] else 0
+
+def run_serve(args: argparse.Namespace) -> int:
+    cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    tile_budget = args.tile_budget * 1024 * 1024 if args.tile_budget else None
+    processor = ImageProcessor(cache=cache, tile_budget=tile_budget, history_max_entries=args.history_max_entries,
+                               history_max_age_days=args.history_max_age, allow_large_images=args.allow_large_images)
+    server = JobServer(processor, requests_file=args.requests,
+                       inbox=args.inbox, outbox=args.outbox, workers=args.workers,
+                       max_in_flight=args.max_in_flight, poll_interval=args.poll_interval)
+    # A Ctrl+C or SIGTERM drains in-flight jobs instead of killing them; workers reset both when they start
+    signal.signal(signal.SIGINT, server.stop)
+    signal.signal(signal.SIGTERM, server.stop)
+
+    def report(record: Dict):
+        if record['status'] == 'done':
+            print(f"{CCTheme.primary('DONE')} {record['job_id']} {record['input']} -> {record['output']} "
+                  f"({record['elapsed'] * 1000:.1f}ms, {(record['latency'] - record['elapsed']) * 1000:.1f}ms overhead)")
+        else:
+            print(f"{CCTheme.ERROR}FAIL{CCTheme.RESET} {record['job_id']}: {record['error']}")
+
+    print(f"{CCTheme.secondary('Serving')} requests={args.requests} inbox={args.inbox} outbox={args.outbox} "
+          f"({server.workers} workers)")
+    stats = server.serve(once=args.once, on_result=report)
+    print(f"\n{CCTheme.secondary('Server stopped:')} {stats['received']} received, {stats['succeeded']} succeeded, "
+          f"{stats['failed']} failed, {stats['duplicates']} duplicates")
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    configure_logging()
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'batch':
+        return run_batch(parser, args)
+    if args.command == 'history':
+        return run_history(args)
+    if args.command == 'serve':
+        return run_serve(args)
+
+    cli = CrisisCoreCLI()
+    cli.run()
+    return 0
+
 if __name__ == '__main__':
     try:
-        cli = CrisisCoreCLI()
-        cli.run()
+        sys.exit(main())
     except Exception as e:
         logging.error(f"Application error: {e}")
         print(CCTheme.ERROR + "A critical error occurred. Check crisiscore.log for details." + CCTheme.RESET)
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from bench_suite import generate_image
+from crisiscore_processor import BatchProcessor, ImageProcessor
+
+@pytest.fixture
+def tree(tmp_path) -> str:
+    os.makedirs(os.path.join(tmp_path, 'nested'))
+    for index, name in enumerate(['a.jpg', 'b.png', os.path.join('nested', 'c.tif')]):
+        generate_image((64 + index, 48), 'RGB', 'photo').save(os.path.join(tmp_path, name))
+    return str(tmp_path)
+
+def run_batch(source: str, operation: str, params: dict, **kwargs) -> dict:
+    return BatchProcessor(ImageProcessor(history_file=None), workers=2).run(source, operation, params, **kwargs)
+
+def files(directory: str) -> set:
+    return {os.path.relpath(os.path.join(root, name), directory)
+            for root, _, names in os.walk(directory) for name in names}
+
+@pytest.mark.parametrize('operation, params', [('resize', {'width': 32, 'height': 24}),
+                                               ('renditions', {'widths': [32, 16], 'formats': ['WEBP', 'PNG']})])
+def test_rerun_processes_only_the_sources(tree, operation, params):
+    first = run_batch(tree, operation, params)
+    after_first = files(tree)
+    second = run_batch(tree, operation, params)
+
+    assert first['succeeded'] == second['succeeded'] == 3
+    # Renditions overwrite their stable names; timestamped outputs add one file per source
+    new = files(tree) - after_first
+    assert len(new) == (0 if operation == 'renditions' else 3)
+    assert not any(name.count(f"_{operation}_") > 1 for name in files(tree))
+
+def test_glob_skips_earlier_results(tree):
+    run_batch(tree, 'rotate', {'angle': 90})
+
+    stats = run_batch(os.path.join(tree, '**', '*.*'), 'flip', {'direction': 'horizontal'})
+
+    assert stats['succeeded'] == 3
+
+def test_resume_skips_finished_inputs(tree):
+    marker = os.path.join(tree, 'done.txt')
+    first = run_batch(tree, 'convert', {'format': 'PNG'}, resume_file=marker)
+    after_first = files(tree)
+
+    second = run_batch(tree, 'convert', {'format': 'PNG'}, resume_file=marker)
+
+    assert (first['succeeded'], first['skipped']) == (3, 0)
+    assert (second['succeeded'], second['skipped']) == (0, 3)
+    assert files(tree) == after_first
+
+def test_resume_picks_up_new_inputs(tree):
+    marker = os.path.join(tree, 'done.txt')
+    run_batch(tree, 'resize', {'width': 32, 'height': 24}, resume_file=marker)
+    generate_image((64, 48), 'RGB', 'noise').save(os.path.join(tree, 'd.webp'))
+
+    stats = run_batch(tree, 'resize', {'width': 32, 'height': 24}, resume_file=marker)
+
+    assert (stats['succeeded'], stats['skipped']) == (1, 3)
+
+@pytest.mark.parametrize('name, expected', [
+    ('a_resize_20260101_120000.jpg', True),
+    ('a_resize_20260101_120000_2.jpg', True),
+    ('a_jpg_512w.webp', True),
+    ('a.jpg', False),
+    ('hero_img_800w.jpg', False),
+    ('holiday_2026_resize.jpg', False),
+])
+def test_output_names_are_recognised(name, expected):
+    assert ImageProcessor.is_output(name) == expected
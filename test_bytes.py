@@ -0,0 +1,128 @@
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image, ImageChops
+
+from bench_suite import generate_image
+from crisiscore_processor import ImageProcessor, StageTimer
+
+@pytest.fixture(scope='module')
+def source() -> Image.Image:
+    return generate_image((48, 30), 'RGB', 'noise')
+
+@pytest.fixture(scope='module')
+def encoded(source) -> bytes:
+    buffer = io.BytesIO()
+    source.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def decode(data) -> Image.Image:
+    with Image.open(io.BytesIO(bytes(data))) as img:
+        img.load()
+    return img
+
+def assert_same_pixels(actual: Image.Image, expected: Image.Image):
+    assert actual.size == expected.size
+    assert ImageChops.difference(actual.convert('RGB'), expected.convert('RGB')).getbbox() is None
+
+def test_bytes_and_memoryview_give_the_same_result(source, encoded):
+    processor = ImageProcessor(history_file=None)
+
+    from_bytes = processor.process_bytes(encoded, 'rotate', angle=90)
+    from_view = processor.process_bytes(memoryview(bytearray(encoded))[:], 'rotate', angle=90)
+
+    assert from_bytes == from_view
+    result = decode(from_bytes)
+    assert result.format == 'PNG'
+    assert_same_pixels(result, source.rotate(90, expand=True))
+
+def test_mapped_file_input(tmp_path, source, encoded):
+    path = os.path.join(tmp_path, 'source.png')
+    with open(path, 'wb') as f:
+        f.write(encoded)
+    timer = StageTimer()
+
+    with ImageProcessor.map_file(path) as mapped:
+        output = ImageProcessor(history_file=None).process_bytes(mapped, 'flip', timer=timer, direction='vertical')
+
+    assert timer.bytes_read == len(encoded)
+    assert timer.bytes_written == len(output)
+    assert_same_pixels(decode(output), source.transpose(Image.Transpose.FLIP_TOP_BOTTOM))
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_raw_pixels_need_no_container(source, mode):
+    img = source.convert(mode)
+    pixels = bytearray(img.tobytes())
+
+    output = ImageProcessor(history_file=None).process_bytes(
+        pixels, 'pipeline', raw={'mode': mode, 'size': img.size},
+        steps=[{'operation': 'rotate', 'angle': 180}, {'operation': 'convert', 'format': 'PNG'}])
+
+    result = decode(output)
+    assert result.mode == mode
+    assert_same_pixels(result, img.rotate(180))
+
+def test_raw_stride_skips_row_padding(source):
+    img = source.convert('L')
+    stride = img.width + 16
+    padded = b''.join(img.tobytes()[y * img.width:(y + 1) * img.width] + bytes(16) for y in range(img.height))
+
+    output = ImageProcessor(history_file=None).process_bytes(
+        padded, 'convert', raw={'mode': 'L', 'size': img.size, 'stride': stride}, format='PNG')
+
+    assert_same_pixels(decode(output), img)
+
+def test_output_buffer_is_filled_in_place(source, encoded):
+    processor = ImageProcessor(history_file=None)
+    expected = processor.process_bytes(encoded, 'rotate', angle=270)
+    buffer = bytearray(len(expected) + 100)
+
+    count = processor.process_bytes(encoded, 'rotate', out=buffer, angle=270)
+
+    assert count == len(expected)
+    assert bytes(buffer[:count]) == expected
+    assert buffer[count:] == bytes(100)
+
+def test_too_small_output_buffer_fails(encoded):
+    processor = ImageProcessor(history_file=None)
+    buffer = bytearray(64)
+
+    assert processor.process_bytes(encoded, 'rotate', out=buffer, angle=90) is None
+    with pytest.raises(ValueError, match='too small'):
+        processor._execute_bytes(encoded, 'rotate', {'angle': 90}, memoryview(buffer), None, StageTimer())
+    # The buffer is released again, so the caller can resize it
+    buffer.extend(bytes(8))
+
+def test_read_only_output_buffer_is_rejected(encoded):
+    assert ImageProcessor(history_file=None).process_bytes(encoded, 'rotate', out=b'\0' * 4096, angle=90) is None
+
+def test_seekable_stream_counts_only_what_was_written(encoded):
+    out = io.BytesIO(b'header')
+    out.seek(0, io.SEEK_END)
+
+    count = ImageProcessor(history_file=None).process_bytes(encoded, 'rotate', out=out, angle=90)
+
+    assert count == len(out.getvalue()) - len(b'header')
+    assert decode(out.getvalue()[len(b'header'):]).size == (30, 48)
+
+@pytest.mark.parametrize('fmt', ['PNG', 'JPEG', 'WEBP'])
+def test_pipe_output_counts_the_bytes_sent(source, encoded, fmt):
+    read_fd, write_fd = os.pipe()
+    received = []
+    reader = threading.Thread(target=lambda: received.append(os.fdopen(read_fd, 'rb').read()))
+    reader.start()
+    with os.fdopen(write_fd, 'wb') as pipe:
+        assert not pipe.seekable()
+        count = ImageProcessor(history_file=None).process_bytes(encoded, 'convert', out=pipe, format=fmt)
+    reader.join(timeout=30)
+
+    assert count == len(received[0])
+    result = decode(received[0])
+    assert result.format == fmt
+    assert result.size == source.size
+
+def test_path_only_operations_are_refused(encoded):
+    with pytest.raises(ValueError, match='in-memory'):
+        ImageProcessor(history_file=None)._execute_bytes(encoded, 'renditions', {}, None, None, StageTimer())
@@ -0,0 +1,133 @@
+import itertools
+import os
+import shutil
+import time
+
+import pytest
+
+from bench_suite import generate_image
+from crisiscore_processor import ImageProcessor, ResultCache
+
+@pytest.fixture
+def cache(tmp_path) -> ResultCache:
+    return ResultCache(os.path.join(tmp_path, 'cache'), max_bytes=1024 ** 2)
+
+@pytest.fixture
+def source(tmp_path) -> str:
+    path = os.path.join(tmp_path, 'source.png')
+    generate_image((64, 48), 'RGB', 'photo').save(path)
+    return path
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Strictly increasing, so LRU order never depends on timer resolution
+    ticks = itertools.count(1)
+    monkeypatch.setattr(time, 'time', lambda: float(next(ticks)))
+
+def write(path: str, size: int) -> str:
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+def test_key_depends_on_content_extension_operation_and_params(tmp_path, cache, source):
+    key = cache.make_key(source, 'resize', {'width': 10, 'height': 20})
+    copy = shutil.copy(source, os.path.join(tmp_path, 'copy.png'))
+    renamed = shutil.copy(source, os.path.join(tmp_path, 'copy.webp'))
+
+    assert cache.make_key(source, 'resize', {'height': 20, 'width': 10}) == key
+    assert cache.make_key(copy, 'resize', {'width': 10, 'height': 20}) == key
+    assert cache.make_key(renamed, 'resize', {'width': 10, 'height': 20}) != key
+    assert cache.make_key(source, 'resize', {'width': 10, 'height': 21}) != key
+    assert cache.make_key(source, 'rotate', {'width': 10, 'height': 20}) != key
+    # A fresh cache object over the same directory agrees
+    assert ResultCache(cache.cache_dir).make_key(source, 'resize', {'width': 10, 'height': 20}) == key
+
+    generate_image((64, 48), 'RGB', 'noise').save(source)
+    assert cache.make_key(source, 'resize', {'width': 10, 'height': 20}) != key
+
+def test_content_digest_survives_a_touch(cache, source):
+    digest = cache.content_digest(source)
+    os.utime(source, ns=(0, 0))
+
+    assert cache.content_digest(source) == digest
+
+def test_fetch_counts_hits_and_misses(tmp_path, cache):
+    output = write(os.path.join(tmp_path, 'out.png'), 100)
+
+    assert not cache.fetch('k', os.path.join(tmp_path, 'miss.png'))
+    cache.store('k', output)
+    assert cache.fetch('k', os.path.join(tmp_path, 'hit.png'))
+
+    with open(output, 'rb') as a, open(os.path.join(tmp_path, 'hit.png'), 'rb') as b:
+        assert a.read() == b.read()
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1, 'bytes': 100}
+
+def test_eviction_drops_the_least_recently_used(tmp_path, cache, clock):
+    cache.max_bytes = 250
+    for name in 'abc':
+        if name == 'c':
+            # Reading a refreshes it, so b is now the oldest
+            assert cache.fetch('a', os.path.join(tmp_path, 'a_again.bin'))
+        cache.store(name, write(os.path.join(tmp_path, f"{name}.bin"), 100))
+
+    assert cache.stats()['evictions'] == 1
+    assert not cache.fetch('b', os.path.join(tmp_path, 'b_again.bin'))
+    assert cache.fetch('a', os.path.join(tmp_path, 'a_third.bin'))
+    assert cache.fetch('c', os.path.join(tmp_path, 'c_again.bin'))
+    assert not os.path.exists(os.path.join(cache.cache_dir, 'b.bin'))
+    assert cache.stats()['bytes'] == 200
+
+def test_blob_evicted_between_lookup_and_link(tmp_path, cache):
+    cache.store('k', write(os.path.join(tmp_path, 'out.png'), 100))
+    # Another process's eviction removed the file after this one read the row
+    os.remove(os.path.join(cache.cache_dir, 'k.png'))
+
+    assert not cache.fetch('k', os.path.join(tmp_path, 'again.png'))
+
+    assert not os.path.exists(os.path.join(tmp_path, 'again.png'))
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+    assert (cache.stats()['misses'], cache.stats()['entries']) == (1, 0)
+
+def test_repeat_hits_return_the_previous_output(tmp_path, cache, source):
+    processor = ImageProcessor(history_file=None, cache=cache)
+    before = set(os.listdir(tmp_path))
+
+    outputs = {processor._execute(source, 'rotate', {'angle': 90}) for _ in range(7)}
+
+    assert len(outputs) == 1
+    assert set(os.listdir(tmp_path)) - before == {os.path.basename(outputs.pop())}
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (6, 1)
+
+def test_hit_links_a_new_output_when_the_previous_one_is_gone(tmp_path, cache, source):
+    processor = ImageProcessor(history_file=None, cache=cache)
+    first = processor._execute(source, 'rotate', {'angle': 90})
+    os.remove(first)
+
+    second = processor._execute(source, 'rotate', {'angle': 90})
+
+    blob = os.path.join(cache.cache_dir, cache.make_key(source, 'rotate', {'angle': 90}) + '.png')
+    assert os.path.samefile(second, blob)
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+def test_identical_inputs_elsewhere_get_their_own_output(tmp_path, cache, source):
+    processor = ImageProcessor(history_file=None, cache=cache)
+    os.makedirs(os.path.join(tmp_path, 'other'))
+    copy = shutil.copy(source, os.path.join(tmp_path, 'other', 'source.png'))
+
+    first = processor._execute(source, 'rotate', {'angle': 90})
+    second = processor._execute(copy, 'rotate', {'angle': 90})
+
+    assert os.path.dirname(second) == os.path.dirname(copy)
+    assert os.path.samefile(first, second)
+    assert cache.stats()['hits'] == 1
+
+def test_edited_output_is_not_handed_back(tmp_path, cache, source):
+    processor = ImageProcessor(history_file=None, cache=cache)
+    first = processor._execute(source, 'rotate', {'angle': 90})
+    # Replaced rather than written through the link, as editors save
+    os.remove(first)
+    write(first, 10)
+
+    second = processor._execute(source, 'rotate', {'angle': 90})
+
+    assert second != first
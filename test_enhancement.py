@@ -0,0 +1,97 @@
+import pytest
+from PIL import Image, ImageChops, ImageEnhance
+
+from bench_suite import generate_image
+from crisiscore_processor import EnhancementEngine, ImageProcessor
+
+ENHANCERS = {
+    'brightness': ImageEnhance.Brightness,
+    'contrast': ImageEnhance.Contrast,
+    'color': ImageEnhance.Color,
+    'sharpness': ImageEnhance.Sharpness,
+}
+
+def make_source(mode: str) -> Image.Image:
+    if mode == 'LA':
+        return generate_image((97, 61), 'RGBA', 'photo').convert('LA')
+    return generate_image((97, 61), mode, 'photo')
+
+def with_image_enhance(img: Image.Image, stages: list) -> Image.Image:
+    # One ImageEnhance pass per stage, in order: the reference the engine is measured against
+    for stage in stages:
+        img = ENHANCERS[stage['enhancement_type']](img).enhance(stage['factor'])
+    return img
+
+def max_difference(a: Image.Image, b: Image.Image) -> int:
+    assert (a.size, a.mode) == (b.size, b.mode)
+    return max(band.getextrema()[1] for band in ImageChops.difference(a, b).split())
+
+def planned_stages(stages: list, size: tuple) -> list:
+    plan, _ = ImageProcessor.plan_pipeline([dict(stage, operation='enhance') for stage in stages], size)
+    assert len(plan) == 1
+    return plan[0]['stages']
+
+@pytest.mark.parametrize('stages, tolerance', [
+    ([('brightness', 1.3)], 0),
+    ([('brightness', 0.6)], 0),
+    ([('contrast', 1.5)], 0),
+    ([('contrast', 0.4)], 0),
+    ([('sharpness', 2.0)], 0),
+    # Stacked point-wise stages compile into one table and still match stage by stage
+    ([('brightness', 1.2), ('contrast', 0.8), ('brightness', 0.9)], 0),
+    ([('contrast', 1.3), ('contrast', 1.3)], 0),
+    # Colour is one matrix pass (and fused colour stages one pass) rather than a grey copy and a blend
+    ([('color', 0.5)], 1),
+    ([('color', 1.7)], 1),
+    ([('color', 0.5), ('color', 0.5)], 1),
+], ids=lambda value: '+'.join(f"{kind}{factor}" for kind, factor in value) if isinstance(value, list) else None)
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_engine_matches_image_enhance(mode, stages, tolerance):
+    source = make_source(mode)
+    stages = [{'enhancement_type': kind, 'factor': factor} for kind, factor in stages]
+
+    result = EnhancementEngine.apply(source, planned_stages(stages, source.size))
+
+    assert max_difference(result, with_image_enhance(source, stages)) <= tolerance
+
+def test_point_wise_run_is_one_table():
+    stages = [{'enhancement_type': 'brightness', 'factor': 1.2},
+              {'enhancement_type': 'gamma', 'factor': 0.8},
+              {'enhancement_type': 'levels', 'black': 10, 'white': 240}]
+
+    assert list(EnhancementEngine.groups(stages)) == [stages]
+    assert len(EnhancementEngine.compile(stages, 'RGBA')) == 4 * 256
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_gamma_and_levels_curves(mode):
+    source = make_source(mode)
+    bands = len(source.getbands()) - ('A' in mode)
+
+    gamma = EnhancementEngine.apply(source, [{'enhancement_type': 'gamma', 'factor': 2.0}])
+    levels = EnhancementEngine.apply(source, [{'enhancement_type': 'levels', 'black': 50, 'white': 200}])
+
+    expected_gamma = source.point([round(255 * (v / 255) ** 0.5) for v in range(256)] * bands
+                                  + (list(range(256)) if 'A' in mode else []))
+    expected_levels = source.point([min(255, max(0, round((v - 50) * 255 / 150))) for v in range(256)] * bands
+                                   + (list(range(256)) if 'A' in mode else []))
+    assert max_difference(gamma, expected_gamma) == 0
+    assert max_difference(levels, expected_levels) == 0
+
+@pytest.mark.parametrize('enhancement_type', ['brightness', 'contrast', 'color', 'sharpness'])
+def test_apply_enhancement_wraps_the_engine(enhancement_type):
+    source = make_source('RGB')
+
+    result = ImageProcessor._apply_enhancement(source, enhancement_type, 1.4)
+
+    assert max_difference(result, ENHANCERS[enhancement_type](source).enhance(1.4)) <= 1
+
+def test_apply_enhancement_takes_levels_points_and_validates():
+    source = make_source('L')
+
+    result = ImageProcessor._apply_enhancement(source, 'levels', black=0, white=255)
+
+    assert max_difference(result, source) == 0
+    with pytest.raises(ValueError):
+        ImageProcessor._apply_enhancement(source, 'sepia', 1.0)
+    with pytest.raises(ValueError):
+        ImageProcessor._apply_enhancement(source, 'gamma', 0)
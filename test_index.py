@@ -0,0 +1,135 @@
+import os
+
+import pytest
+from PIL import Image, ImageFile
+
+from bench_suite import generate_image
+from crisiscore_processor import FileExplorer, ImageIndex
+
+def exif_with_orientation(orientation: int) -> Image.Exif:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return exif
+
+@pytest.fixture
+def explorer(tmp_path) -> FileExplorer:
+    explorer = FileExplorer(page_size=3)
+    explorer.current_path = str(tmp_path)
+    return explorer
+
+@pytest.fixture
+def directory(tmp_path) -> str:
+    # name: (size, format); sizes also make the byte sizes differ
+    for name, size in [('b.jpg', (640, 480)), ('a.png', (32, 24)), ('c.tif', (4800, 3200)), ('d.webp', (96, 64))]:
+        generate_image(size, 'RGB', 'noise').save(os.path.join(tmp_path, name))
+    os.makedirs(os.path.join(tmp_path, 'sub'))
+    os.makedirs(os.path.join(tmp_path, 'other'))
+    with open(os.path.join(tmp_path, 'notes.txt'), 'w') as f:
+        f.write('not an image')
+    return str(tmp_path)
+
+@pytest.mark.parametrize('fmt', ['jpg', 'png', 'tif', 'webp'])
+def test_probe_reads_orientation_without_decoding(tmp_path, monkeypatch, fmt):
+    path = os.path.join(tmp_path, f"oriented.{fmt}")
+    generate_image((40, 30), 'RGB', 'noise').save(path, exif=exif_with_orientation(6))
+
+    def refuse(*args, **kwargs):
+        raise AssertionError('probe decoded the pixels')
+    monkeypatch.setattr(ImageFile.ImageFile, 'load', refuse)
+
+    info = FileExplorer.probe(path)
+
+    assert info['orientation'] == 6
+    assert info['mode'] == 'RGB'
+    assert info['width'] * info['height'] == 40 * 30
+
+def test_probe_defaults_to_upright(tmp_path):
+    path = os.path.join(tmp_path, 'plain.png')
+    generate_image((40, 30), 'RGB', 'noise').save(path)
+
+    assert FileExplorer.probe(path) == {'width': 40, 'height': 30, 'mode': 'RGB', 'format': 'PNG', 'orientation': 1}
+
+def test_index_probes_each_file_once(directory, explorer, monkeypatch):
+    probed = []
+    probe = FileExplorer.probe
+    monkeypatch.setattr(FileExplorer, 'probe', staticmethod(lambda path: probed.append(path) or probe(path)))
+
+    index = explorer.get_image_index(directory)
+    assert sorted(os.path.basename(path) for path in probed) == ['a.png', 'b.jpg', 'c.tif', 'd.webp']
+    assert index.get('c.tif')['format'] == 'TIFF'
+
+    probed.clear()
+    explorer.get_image_index(directory)
+    # A fresh explorer starts from the saved index file
+    FileExplorer().get_image_index(directory)
+    assert probed == []
+
+    # Replaced under the same name: a new size and mtime, so only it is probed again
+    temp_path = os.path.join(directory, 'replacement.tmp')
+    generate_image((50, 50), 'L', 'noise').save(temp_path, format='PNG')
+    os.replace(temp_path, os.path.join(directory, 'a.png'))
+    index = explorer.get_image_index(directory)
+    assert [os.path.basename(path) for path in probed] == ['a.png']
+    assert (index.get('a.png')['mode'], index.get('a.png')['width']) == ('L', 50)
+
+def test_index_drops_deleted_files_and_records_unreadable_ones(directory, explorer):
+    os.remove(os.path.join(directory, 'd.webp'))
+    with open(os.path.join(directory, 'broken.jpg'), 'wb') as f:
+        f.write(b'not a jpeg')
+
+    index = explorer.get_image_index(directory)
+
+    assert index.get('d.webp') is None
+    assert 'error' in index.get('broken.jpg')
+    assert [entry['name'] for entry in index.query([])] == ['a.png', 'b.jpg', 'c.tif']
+
+def test_parse_filter():
+    assert ImageIndex.parse_filter('format=JPEG width>4000 Orientation!=1 pixels<=100') == [
+        ('format', '=', 'JPEG'), ('width', '>', 4000), ('orientation', '!=', 1), ('pixels', '<=', 100)]
+    for expression in ('colour=red', 'width', 'width>'):
+        with pytest.raises(ValueError):
+            ImageIndex.parse_filter(expression)
+
+@pytest.mark.parametrize('expression, expected', [
+    ('format=jpeg', True),
+    ('format!=JPEG', False),
+    ('width>=640 height<480', False),
+    ('width>=640 height<=480', True),
+    ('pixels>300000', True),
+    ('mode=2', False),
+    ('orientation=6', True),
+])
+def test_matches(expression, expected):
+    entry = {'name': 'b.jpg', 'width': 640, 'height': 480, 'mode': 'RGB', 'format': 'JPEG', 'orientation': 6}
+
+    assert ImageIndex.matches(entry, ImageIndex.parse_filter(expression)) == expected
+
+def test_unreadable_entries_never_match():
+    assert not ImageIndex.matches({'name': 'x.jpg', 'size': 3, 'error': 'broken'}, [])
+
+def test_list_page_puts_folders_first_and_pages_through(directory, explorer):
+    pages = [explorer.list_page(page) for page in range(3)]
+
+    assert [(page['folders'], page['files']) for page in pages[:2]] == [
+        (['other', 'sub'], ['a.png']), ([], ['b.jpg', 'c.tif', 'd.webp'])]
+    assert pages[0]['total'] == 6 and pages[0]['pages'] == 2
+    # Out-of-range pages clamp to the last one
+    assert pages[2] == pages[1]
+    assert explorer.list_page(-5)['page'] == 0
+
+def test_list_page_sorts_and_filters(directory, explorer):
+    by_size = explorer.list_page(page_size=10, sort='size', reverse=True)['files']
+    sizes = [os.path.getsize(os.path.join(directory, name)) for name in by_size]
+
+    assert sizes == sorted(sizes, reverse=True)
+    assert explorer.list_page(page_size=10, sort='type')['files'] == ['b.jpg', 'a.png', 'c.tif', 'd.webp']
+    assert explorer.list_page(page_size=10, pattern='*.P*')['files'] == ['a.png']
+    assert explorer.list_page(page_size=10, where=ImageIndex.parse_filter('width>=640'))['files'] == [
+        'b.jpg', 'c.tif']
+
+def test_list_page_sees_new_files(directory, explorer):
+    assert explorer.list_page(page_size=10)['total'] == 6
+
+    generate_image((8, 8), 'RGB', 'noise').save(os.path.join(directory, 'e.png'))
+
+    assert explorer.list_page(page_size=10)['files'][-1] == 'e.png'
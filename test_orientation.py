@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+
+import pytest
+from PIL import Image, ImageChops, ImageOps
+
+from bench_suite import generate_image
+from crisiscore_processor import ImageProcessor, StageTimer
+
+ORIENTATION = ImageProcessor.EXIF_ORIENTATION
+
+def exif_with(orientation: int, endian: str) -> Image.Exif:
+    exif = Image.Exif()
+    exif.endian = endian
+    exif[0x010F] = 'CrisisCore'  # Make
+    exif[ORIENTATION] = orientation
+    exif[0x0131] = 'test'  # Software, after the orientation entry
+    return exif
+
+def assert_same_pixels(actual: Image.Image, expected: Image.Image):
+    assert actual.size == expected.size
+    assert ImageChops.difference(actual.convert('RGB'), expected.convert('RGB')).getbbox() is None
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_reset_jpeg_orientation_patches_only_the_tag(tmp_path, orientation, endian):
+    path = os.path.join(tmp_path, 'photo.jpg')
+    generate_image((64, 48), 'RGB', 'photo').save(path, exif=exif_with(orientation, endian))
+    with open(path, 'rb') as f:
+        before = f.read()
+
+    ImageProcessor._reset_jpeg_orientation(path)
+
+    with open(path, 'rb') as f:
+        after = f.read()
+    # Same length, at most the two value bytes changed
+    assert len(after) == len(before)
+    assert sum(a != b for a, b in zip(before, after)) <= 2
+    with Image.open(path) as img:
+        exif = img.getexif()
+        assert exif[ORIENTATION] == 1
+        assert exif[0x010F] == 'CrisisCore'
+        assert exif[0x0131] == 'test'
+
+def test_reset_jpeg_orientation_leaves_files_without_exif_alone(tmp_path):
+    path = os.path.join(tmp_path, 'plain.jpg')
+    generate_image((64, 48), 'RGB', 'photo').save(path)
+    with open(path, 'rb') as f:
+        before = f.read()
+
+    ImageProcessor._reset_jpeg_orientation(path)
+
+    with open(path, 'rb') as f:
+        assert f.read() == before
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+@pytest.mark.parametrize('fmt', ['png', 'tiff'])
+def test_orient_makes_pixels_upright(tmp_path, fmt, orientation):
+    path = os.path.join(tmp_path, f"stored.{fmt}")
+    generate_image((48, 30), 'RGB', 'noise').save(path, exif=exif_with(orientation, '<'))
+    with Image.open(path) as stored:
+        expected = ImageOps.exif_transpose(stored)
+
+    output = ImageProcessor(history_file=None)._execute(path, 'orient', {})
+
+    with Image.open(output) as result:
+        assert_same_pixels(result, expected)
+        # The rotation is applied, so it must not be applied again by a viewer
+        assert result.getexif().get(ORIENTATION, 1) == 1
+        assert result.getexif()[0x010F] == 'CrisisCore'
+
+@pytest.mark.parametrize('orientation', [3, 6, 7])
+@pytest.mark.parametrize('fmt', ['png', 'tiff'])
+def test_orient_composes_with_later_steps(tmp_path, fmt, orientation):
+    path = os.path.join(tmp_path, f"stored.{fmt}")
+    generate_image((48, 30), 'RGB', 'noise').save(path, exif=exif_with(orientation, '<'))
+    with Image.open(path) as stored:
+        expected = ImageOps.exif_transpose(stored).rotate(90, expand=True).transpose(
+            Image.Transpose.FLIP_LEFT_RIGHT)
+    steps = [{'operation': 'orient'}, {'operation': 'rotate', 'angle': 90},
+             {'operation': 'flip', 'direction': 'horizontal'}, {'operation': 'orient'}]
+
+    output = ImageProcessor(history_file=None)._execute(path, 'pipeline', {'steps': steps})
+
+    with Image.open(output) as result:
+        assert_same_pixels(result, expected)
+
+@pytest.mark.parametrize('fmt', ['png', 'tiff'])
+def test_orient_then_resize_reports_the_new_size(tmp_path, fmt):
+    path = os.path.join(tmp_path, f"stored.{fmt}")
+    generate_image((40, 30), 'RGB', 'noise').save(path, exif=exif_with(6, '<'))
+    steps = [{'operation': 'orient'}, {'operation': 'resize', 'width': 10, 'height': 20}]
+
+    output = ImageProcessor(history_file=None)._execute(path, 'pipeline', {'steps': steps})
+
+    with Image.open(output) as result:
+        assert result.size == (10, 20)
+        result.load()
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+def test_tiled_tiff_matches_the_decoded_frame(tmp_path, orientation):
+    # Pillow turns a TIFF upright as it decodes it; strips read straight from the file must agree
+    path = os.path.join(tmp_path, 'stored.tiff')
+    generate_image((300, 270), 'RGB', 'photo').save(path, exif=exif_with(orientation, '<'))
+    steps = [{'operation': 'rotate', 'angle': 90}, {'operation': 'convert', 'format': 'PNG'}]
+    timer = StageTimer()
+
+    tiled = ImageProcessor(history_file=None, tile_budget=4096)._execute(path, 'pipeline', {'steps': steps}, timer)
+    whole = ImageProcessor(history_file=None)._execute(path, 'pipeline', {'steps': steps})
+
+    with Image.open(tiled) as a, Image.open(whole) as b:
+        assert_same_pixels(a, b)
+    # Rows stored sideways or mirrored can't be read as strips; those decode whole
+    assert (timer.peak_image_bytes < 300 * 270 * 3) == (orientation == 1)
+
+def test_renditions_of_an_oriented_tiff_keep_its_aspect(tmp_path):
+    path = os.path.join(tmp_path, 'stored.tiff')
+    generate_image((40, 30), 'RGB', 'noise').save(path, exif=exif_with(6, '<'))
+
+    manifest_path = ImageProcessor(history_file=None)._execute(path, 'renditions', {'widths': [15], 'formats': ['PNG']})
+
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    assert (manifest['width'], manifest['height']) == (30, 40)
+    with Image.open(os.path.join(tmp_path, manifest['renditions'][0]['path'])) as rendition:
+        assert rendition.size == (15, 20)
+
+def test_lossless_request_falls_back_to_pixels_without_jpegtran(tmp_path, monkeypatch):
+    path = os.path.join(tmp_path, 'photo.jpg')
+    generate_image((64, 48), 'RGB', 'photo').save(path)
+    monkeypatch.setattr(shutil, 'which', lambda name: None)
+
+    output = ImageProcessor(history_file=None)._execute(path, 'rotate', {'angle': 90, 'lossless': True})
+
+    with Image.open(output) as result:
+        assert result.size == (48, 64)
+
+@pytest.mark.skipif(not shutil.which('jpegtran'), reason='jpegtran is not installed')
+def test_lossless_orient_resets_the_tag(tmp_path):
+    path = os.path.join(tmp_path, 'photo.jpg')
+    # Whole MCUs in both directions, so -perfect succeeds
+    generate_image((64, 48), 'RGB', 'photo').save(path, exif=exif_with(6, '>'))
+
+    output = ImageProcessor(history_file=None)._execute(path, 'orient', {'lossless': True})
+
+    with Image.open(output) as result:
+        assert result.size == (48, 64)
+        assert result.getexif()[ORIENTATION] == 1
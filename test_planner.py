@@ -0,0 +1,134 @@
+import itertools
+import os
+
+import pytest
+from PIL import Image, ImageChops
+
+from bench_suite import generate_image
+from crisiscore_processor import ImageProcessor
+
+TRANSFORMS = [
+    {'operation': 'rotate', 'angle': 90},
+    {'operation': 'rotate', 'angle': 180},
+    {'operation': 'rotate', 'angle': 270},
+    {'operation': 'flip', 'direction': 'horizontal'},
+    {'operation': 'flip', 'direction': 'vertical'},
+]
+
+def apply_naively(img: Image.Image, steps: list) -> Image.Image:
+    # One Pillow call per requested step, in order: what the planner must be equivalent to
+    for step in steps:
+        if step['operation'] == 'rotate':
+            img = img.rotate(step['angle'], expand=True)
+        elif step['operation'] == 'flip':
+            img = img.transpose(Image.Transpose.FLIP_LEFT_RIGHT if step['direction'] == 'horizontal'
+                                else Image.Transpose.FLIP_TOP_BOTTOM)
+        elif step['operation'] == 'resize':
+            img = img.resize((step['width'], step['height']))
+    return img
+
+def apply_plan(img: Image.Image, plan: list) -> Image.Image:
+    processor = ImageProcessor(history_file=None)
+    for step in plan:
+        img = processor._apply_step(img, step)
+    return img
+
+def assert_same_pixels(actual: Image.Image, expected: Image.Image):
+    assert actual.size == expected.size
+    assert ImageChops.difference(actual, expected).getbbox() is None
+
+@pytest.fixture(scope='module')
+def source() -> Image.Image:
+    # Not square, so every wrong rotation also has the wrong size
+    return generate_image((48, 30), 'RGB', 'noise')
+
+@pytest.mark.parametrize('steps', [list(combo) for n in (1, 2, 3) for combo in itertools.product(TRANSFORMS, repeat=n)],
+                         ids=lambda steps: '+'.join(f"{s['operation']}{s.get('angle', s.get('direction'))}"
+                                                    for s in steps))
+def test_transposes_fold_into_at_most_one_step(source, steps):
+    plan, output_format = ImageProcessor.plan_pipeline(steps, source.size)
+
+    assert output_format is None
+    assert len(plan) <= 1
+    assert_same_pixels(apply_plan(source, plan), apply_naively(source, steps))
+
+def test_inverse_transposes_cancel_out(source):
+    for steps in ([TRANSFORMS[0], TRANSFORMS[2]], [TRANSFORMS[3], TRANSFORMS[3]], [TRANSFORMS[1], TRANSFORMS[1]],
+                  [TRANSFORMS[3], TRANSFORMS[4], TRANSFORMS[1]]):
+        assert ImageProcessor.plan_pipeline(steps, source.size)[0] == []
+
+def test_consecutive_resizes_keep_only_the_last():
+    steps = [{'operation': 'resize', 'width': 400, 'height': 300},
+             {'operation': 'resize', 'width': 40, 'height': 30}]
+
+    plan, _ = ImageProcessor.plan_pipeline(steps, (800, 600))
+
+    assert plan == [{'operation': 'resize', 'width': 40, 'height': 30}]
+
+def test_downscale_moves_ahead_of_a_transpose(source):
+    steps = [{'operation': 'rotate', 'angle': 90}, {'operation': 'resize', 'width': 15, 'height': 24}]
+
+    plan, _ = ImageProcessor.plan_pipeline(steps, source.size)
+
+    # Shrinking first means the transpose touches a quarter of the pixels; the size swaps to match
+    assert [step['operation'] for step in plan] == ['resize', 'transpose']
+    assert (plan[0]['width'], plan[0]['height']) == (24, 15)
+    assert apply_plan(source, plan).size == apply_naively(source, steps).size
+
+def test_upscale_stays_after_a_transpose(source):
+    steps = [{'operation': 'rotate', 'angle': 90}, {'operation': 'resize', 'width': 60, 'height': 96}]
+
+    plan, _ = ImageProcessor.plan_pipeline(steps, source.size)
+
+    assert [step['operation'] for step in plan] == ['transpose', 'resize']
+    assert_same_pixels(apply_plan(source, plan), apply_naively(source, steps))
+
+def test_last_convert_decides_the_output_format():
+    steps = [{'operation': 'convert', 'format': 'PNG'}, {'operation': 'rotate', 'angle': 30},
+             {'operation': 'convert', 'format': 'WEBP'}]
+
+    plan, output_format = ImageProcessor.plan_pipeline(steps, (100, 50))
+
+    assert output_format == 'WEBP'
+    assert plan == [{'operation': 'rotate', 'angle': 30}]
+
+def test_enhancement_runs_become_one_step():
+    steps = [{'operation': 'enhance', 'enhancement_type': 'brightness', 'factor': 1.2},
+             {'operation': 'enhance', 'enhancement_type': 'contrast', 'factor': 1.0},
+             {'operation': 'enhance', 'enhancement_type': 'gamma', 'factor': 0.8}]
+
+    plan, _ = ImageProcessor.plan_pipeline(steps, (100, 50))
+
+    assert len(plan) == 1
+    # The identity contrast is dropped; the other two stay in order
+    assert [stage['enhancement_type'] for stage in plan[0]['stages']] == ['brightness', 'gamma']
+
+def test_color_stages_fuse_while_nothing_clips():
+    steps = [{'operation': 'enhance', 'enhancement_type': 'color', 'factor': 0.5},
+             {'operation': 'enhance', 'enhancement_type': 'color', 'factor': 0.5}]
+
+    plan, _ = ImageProcessor.plan_pipeline(steps, (100, 50))
+
+    assert [stage['factor'] for stage in plan[0]['stages']] == [0.25]
+
+@pytest.mark.parametrize('step', [{'operation': 'crop'}, {'operation': 'flip', 'direction': 'diagonal'},
+                                  {'operation': 'resize', 'width': 10, 'height': 10, 'tier': 'turbo'},
+                                  {'operation': 'enhance', 'enhancement_type': 'sepia', 'factor': 1.0}])
+def test_invalid_steps_are_rejected(step):
+    with pytest.raises(ValueError):
+        ImageProcessor.plan_pipeline([step], (100, 50))
+
+def test_pipeline_output_matches_separate_operations(tmp_path, source):
+    path = os.path.join(tmp_path, 'source.png')
+    source.save(path)
+    steps = [{'operation': 'rotate', 'angle': 90}, {'operation': 'flip', 'direction': 'horizontal'},
+             {'operation': 'rotate', 'angle': 180}]
+    processor = ImageProcessor(history_file=None)
+
+    fused = processor._execute(path, 'pipeline', {'steps': steps})
+    chained = path
+    for step in steps:
+        chained = processor._execute(chained, step['operation'], {k: v for k, v in step.items() if k != 'operation'})
+
+    with Image.open(fused) as a, Image.open(chained) as b:
+        assert_same_pixels(a, b)
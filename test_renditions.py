@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from bench_suite import generate_image
+from crisiscore_processor import ImageProcessor
+
+@pytest.fixture
+def source(tmp_path) -> str:
+    path = os.path.join(tmp_path, 'a.png')
+    generate_image((800, 600), 'RGB', 'photo').save(path)
+    return path
+
+def make_renditions(path: str, widths: list, formats: list = ('PNG',), **kwargs) -> dict:
+    manifest_path = ImageProcessor(history_file=None)._execute(
+        path, 'renditions', dict(kwargs, widths=widths, formats=list(formats)))
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+def test_each_width_resamples_the_smallest_rendition_twice_its_size(source, monkeypatch):
+    bases = {}
+    apply_step = ImageProcessor._apply_step
+
+    def recording(self, img, step):
+        bases[step['width']] = img.width
+        return apply_step(self, img, step)
+
+    monkeypatch.setattr(ImageProcessor, '_apply_step', recording)
+
+    make_renditions(source, [90, 400, 100, 200])
+
+    # 90 skips the 100 rendition (less than twice as wide) and comes from 200
+    assert bases == {400: 800, 200: 400, 100: 200, 90: 200}
+
+def test_cascaded_renditions_stay_close_to_a_direct_resize(source):
+    manifest = make_renditions(source, [400, 200, 100])
+
+    with Image.open(source) as original:
+        for entry in manifest['renditions']:
+            expected = original.resize((entry['width'], entry['height']), Image.Resampling.LANCZOS)
+            with Image.open(os.path.join(os.path.dirname(source), entry['path'])) as rendition:
+                difference = ImageChops.difference(rendition.convert('RGB'), expected)
+                assert max(ImageStat.Stat(difference).mean) < 2.0
+
+def test_widths_past_the_source_collapse_into_one_full_size_rendition(tmp_path):
+    path = os.path.join(tmp_path, 'small.png')
+    original = generate_image((100, 60), 'RGB', 'noise')
+    original.save(path)
+
+    manifest = make_renditions(path, [1000, 50, 2000, 100, 50])
+
+    assert [(entry['width'], entry['height']) for entry in manifest['renditions']] == [(100, 60), (50, 30)]
+    with Image.open(os.path.join(tmp_path, 'small_png_100w.png')) as full:
+        assert ImageChops.difference(full.convert('RGB'), original).getbbox() is None
+
+def test_sources_sharing_a_stem_do_not_overwrite_each_other(tmp_path):
+    img = generate_image((120, 90), 'RGB', 'photo')
+    jpeg, png = os.path.join(tmp_path, 'a.jpg'), os.path.join(tmp_path, 'a.png')
+    img.save(jpeg)
+    img.rotate(90, expand=True).save(png)
+
+    from_jpeg = make_renditions(jpeg, [60], ['JPEG', 'WEBP'])
+    from_png = make_renditions(png, [60], ['JPEG', 'WEBP'])
+
+    assert {entry['path'] for entry in from_jpeg['renditions']} == {'a_jpg_60w.jpg', 'a_jpg_60w.webp'}
+    assert {entry['path'] for entry in from_png['renditions']} == {'a_png_60w.jpg', 'a_png_60w.webp'}
+    assert os.path.exists(os.path.join(tmp_path, 'a_jpg_renditions.json'))
+    assert os.path.exists(os.path.join(tmp_path, 'a_png_renditions.json'))
+    with Image.open(os.path.join(tmp_path, 'a_jpg_60w.jpg')) as a, Image.open(os.path.join(tmp_path, 'a_png_60w.jpg')) as b:
+        assert (a.size, b.size) == ((60, 45), (60, 80))
+
+def test_manifest_describes_every_file(source):
+    manifest = make_renditions(source, [300, 150], ['JPEG', 'WEBP', 'PNG'], quality=70)
+
+    assert (manifest['source'], manifest['width'], manifest['height']) == ('a.png', 800, 600)
+    assert [(entry['width'], entry['format']) for entry in manifest['renditions']] == [
+        (300, 'JPEG'), (300, 'WEBP'), (300, 'PNG'), (150, 'JPEG'), (150, 'WEBP'), (150, 'PNG')]
+    for entry in manifest['renditions']:
+        path = os.path.join(os.path.dirname(source), entry['path'])
+        assert entry['bytes'] == os.path.getsize(path)
+        with Image.open(path) as rendition:
+            assert (rendition.format, rendition.size) == (entry['format'], (entry['width'], entry['height']))
+
+def test_transparent_source_flattens_only_for_jpeg(tmp_path):
+    path = os.path.join(tmp_path, 'alpha.png')
+    generate_image((80, 60), 'RGBA', 'photo').save(path)
+
+    manifest = make_renditions(path, [40], ['JPEG', 'PNG'])
+
+    modes = {}
+    for entry in manifest['renditions']:
+        with Image.open(os.path.join(tmp_path, entry['path'])) as rendition:
+            modes[entry['format']] = rendition.mode
+    assert modes == {'JPEG': 'RGB', 'PNG': 'RGBA'}
+
+@pytest.mark.parametrize('kwargs', [{'widths': [100], 'formats': ['GIF']}, {'widths': [100], 'formats': []},
+                                    {'widths': [], 'formats': ['PNG']}, {'widths': [0], 'formats': ['PNG']},
+                                    {'widths': [100], 'formats': ['PNG'], 'tier': 'turbo'}])
+def test_invalid_requests_are_rejected(source, kwargs):
+    with pytest.raises(ValueError):
+        ImageProcessor(history_file=None)._execute(source, 'renditions', kwargs)
@@ -0,0 +1,100 @@
+import os
+from collections import deque
+
+import pytest
+
+from bench_suite import generate_image
+from crisiscore_processor import MemoryScheduler
+
+def drain(scheduler: MemoryScheduler, slots: int) -> list:
+    return [item for item, _ in scheduler.admit(slots)]
+
+@pytest.mark.parametrize('slots', [4, 16])
+@pytest.mark.parametrize('finishing', [1, 4])
+def test_large_job_is_not_starved_by_small_ones(slots, finishing):
+    scheduler = MemoryScheduler(100)
+    running = deque()
+    for index in range(4):
+        scheduler.add(f"small{index}", 15)
+    running.extend(scheduler.admit(slots))
+    scheduler.add('large', 60)
+
+    for round_number in range(500):
+        for _ in range(min(finishing, len(running))):
+            scheduler.release(running.popleft()[1])
+        for index in range(4):
+            scheduler.add(f"small{round_number}_{index}", 15)
+        admitted = scheduler.admit(slots - len(running))
+        running.extend(admitted)
+        assert scheduler.in_flight_bytes <= 100
+        if ('large', 60) in admitted:
+            break
+    else:
+        pytest.fail('the large job was never admitted')
+    # Passed over at most MAX_SKIPS times, then held back the small ones until memory drained for it
+    assert round_number <= MemoryScheduler.MAX_SKIPS + 100 // 15
+
+def test_smallest_jobs_go_first_while_nothing_starves():
+    scheduler = MemoryScheduler(100)
+    for item, estimate in [('c', 30), ('a', 10), ('b', 20), ('d', 50)]:
+        scheduler.add(item, estimate)
+
+    assert drain(scheduler, 8) == ['a', 'b', 'c']
+    assert scheduler.in_flight_bytes == 60
+    # d is older than nothing admitted, so waiting on memory alone doesn't count against it
+    assert scheduler.queue[0][2] == 0
+
+def test_oversized_job_runs_alone():
+    scheduler = MemoryScheduler(100)
+    scheduler.add('huge', 150)
+    scheduler.add('tiny', 10)
+
+    assert drain(scheduler, 4) == ['tiny']
+    scheduler.release(10)
+    assert drain(scheduler, 4) == ['huge']
+    scheduler.add('later', 10)
+    assert drain(scheduler, 4) == []
+    scheduler.release(150)
+    assert drain(scheduler, 4) == ['later']
+    assert scheduler.metrics['oversized'] == 1
+
+def test_deferred_counts_jobs_and_stalls_count_passes():
+    scheduler = MemoryScheduler(100)
+    scheduler.add('first', 50)
+    scheduler.add('waits', 60)
+
+    assert drain(scheduler, 4) == ['first']
+    assert drain(scheduler, 4) == []
+    assert drain(scheduler, 4) == []
+    scheduler.release(50)
+    assert drain(scheduler, 4) == ['waits']
+
+    metrics = scheduler.metrics
+    assert (metrics['deferred'], metrics['stalls']) == (1, 3)
+    assert (metrics['admitted'], metrics['admitted_bytes']) == (2, 110)
+    assert (metrics['peak_in_flight_bytes'], metrics['max_queue_depth'], metrics['queue_depth']) == (60, 2, 0)
+
+def test_slot_limit_is_not_a_memory_stall():
+    scheduler = MemoryScheduler(100)
+    for index in range(4):
+        scheduler.add(index, 10)
+
+    assert drain(scheduler, 2) == [0, 1]
+    assert (scheduler.metrics['deferred'], scheduler.metrics['stalls']) == (0, 0)
+
+def test_queue_reports_full_for_backpressure():
+    scheduler = MemoryScheduler(100, max_queued=2)
+    scheduler.add('a', 10)
+    assert not scheduler.full()
+    scheduler.add('b', 10)
+    assert scheduler.full()
+
+def test_estimate_scales_the_decoded_frame_by_operation(tmp_path):
+    path = os.path.join(tmp_path, 'source.png')
+    generate_image((64, 48), 'RGB', 'photo').save(path)
+    frame = 64 * 48 * 4
+
+    assert MemoryScheduler.estimate(path, 'convert', {}) == frame
+    assert MemoryScheduler.estimate(path, 'enhance', {}) == frame * 3
+    assert MemoryScheduler.estimate(path, 'pipeline', {'steps': [{'operation': 'resize'}]}) == frame * 2
+    assert MemoryScheduler.estimate(os.path.join(tmp_path, 'missing.png'), 'convert', {}) == 0
@@ -0,0 +1,152 @@
+import json
+import os
+import signal
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import crisiscore_processor
+from bench_suite import generate_image
+from crisiscore_processor import ImageProcessor, JobServer, _process_batch_item
+
+@pytest.fixture
+def source(tmp_path) -> str:
+    path = os.path.join(tmp_path, 'source.png')
+    generate_image((64, 48), 'RGB', 'photo').save(path)
+    return path
+
+def make_server(tmp_path, **kwargs) -> JobServer:
+    kwargs.setdefault('requests_file', os.path.join(tmp_path, 'requests.jsonl'))
+    return JobServer(ImageProcessor(history_file=None), outbox=os.path.join(tmp_path, 'outbox.jsonl'),
+                     workers=1, **kwargs)
+
+def submit(server: JobServer, *requests):
+    with open(server.requests_file, 'ab') as f:
+        for request in requests:
+            f.write((request if isinstance(request, str) else json.dumps(request)).encode() + b'\n')
+
+def read_outbox(server: JobServer) -> list:
+    with open(server.outbox_path, 'r') as f:
+        return [json.loads(line) for line in f]
+
+def results(server: JobServer) -> dict:
+    return {record['job_id']: record for record in read_outbox(server) if record['status'] in JobServer.TERMINAL}
+
+def test_duplicate_job_ids_run_once(tmp_path, source):
+    server = make_server(tmp_path)
+    job = {'job_id': 'a', 'input': source, 'operation': 'rotate', 'params': {'angle': 90}}
+    submit(server, job, job)
+
+    stats = server.serve(once=True)
+
+    assert stats['succeeded'] == 1
+    assert stats['duplicates'] == 1
+    assert [record['status'] for record in read_outbox(server)] == ['running', 'done']
+
+def test_restart_resumes_after_the_acknowledged_offset(tmp_path, source):
+    first = make_server(tmp_path)
+    submit(first, {'job_id': 'a', 'input': source, 'operation': 'rotate', 'params': {'angle': 90}})
+    first.serve(once=True)
+    with open(first.offset_file, 'r') as f:
+        assert int(f.read()) == os.path.getsize(first.requests_file)
+
+    # A resubmitted finished job is a duplicate even across restarts; only the new line runs
+    submit(first, {'job_id': 'a', 'input': source, 'operation': 'rotate', 'params': {'angle': 90}},
+           {'job_id': 'b', 'input': source, 'operation': 'flip', 'params': {'direction': 'vertical'}})
+    second = make_server(tmp_path)
+    stats = second.serve(once=True)
+
+    assert (stats['received'], stats['succeeded'], stats['duplicates']) == (2, 1, 1)
+    assert set(results(second)) == {'a', 'b'}
+    with open(second.offset_file, 'r') as f:
+        assert int(f.read()) == os.path.getsize(second.requests_file)
+
+def test_inbox_jobs_move_to_processed(tmp_path, source):
+    inbox = os.path.join(tmp_path, 'inbox')
+    os.makedirs(inbox)
+    with open(os.path.join(inbox, 'job1.json'), 'w') as f:
+        json.dump({'job_id': 'c', 'input': source, 'operation': 'convert', 'params': {'format': 'WEBP'}}, f)
+    server = make_server(tmp_path, requests_file=None, inbox=inbox)
+
+    stats = server.serve(once=True)
+
+    assert stats['succeeded'] == 1
+    with Image.open(results(server)['c']['output']) as result:
+        assert result.format == 'WEBP'
+    assert not os.path.exists(os.path.join(inbox, 'job1.json'))
+    assert os.path.exists(os.path.join(inbox, 'processed', 'job1.json'))
+
+def test_malformed_lines_fail_without_stalling_the_offset(tmp_path, source):
+    server = make_server(tmp_path)
+    submit(server, 'not json', '[1, 2]',
+           {'job_id': 'p', 'input': source, 'operation': 'resize', 'params': 5},
+           {'job_id': 's', 'input': source, 'operation': 'pipeline', 'steps': [1]},
+           {'job_id': 'o', 'input': source, 'operation': 'sharpen'},
+           {'job_id': 'i', 'input': 'missing.png', 'operation': 'rotate'},
+           {'job_id': 'ok', 'input': source, 'operation': 'rotate', 'params': {'angle': 180}})
+
+    stats = server.serve(once=True)
+
+    assert (stats['failed'], stats['succeeded']) == (6, 1)
+    finished = results(server)
+    assert finished['ok']['status'] == 'done'
+    assert all(finished[job_id]['status'] == 'failed' for job_id in 'psoi')
+    with open(server.offset_file, 'r') as f:
+        assert int(f.read()) == os.path.getsize(server.requests_file)
+
+def misbehave(input_path: str, operation: str, params: dict) -> dict:
+    if params.get('die'):
+        # What the kernel's OOM killer does
+        os.kill(os.getpid(), signal.SIGKILL)
+    if params.get('hang'):
+        open(params['hang'], 'w').close()
+        time.sleep(60)
+    return _process_batch_item(input_path, operation, params)
+
+def test_dead_worker_fails_in_flight_jobs_and_the_server_keeps_going(tmp_path, source, monkeypatch):
+    monkeypatch.setattr(crisiscore_processor, '_process_batch_item', misbehave)
+    server = make_server(tmp_path)
+    server.workers = 2
+    received = {}
+    arrived = threading.Condition()
+
+    def on_result(record: dict):
+        with arrived:
+            received[record['job_id']] = record
+            arrived.notify_all()
+
+    def wait_for(job_id: str, timeout: float = 60) -> dict:
+        with arrived:
+            assert arrived.wait_for(lambda: job_id in received, timeout=timeout)
+        return received[job_id]
+
+    # As run_serve installs it. A worker that inherited it would shrug off the pool's terminate()
+    # and hold up the restart until its job finished
+    previous = signal.signal(signal.SIGTERM, server.stop)
+    thread = threading.Thread(target=server.serve, kwargs={'on_result': on_result})
+    started = os.path.join(tmp_path, 'started')
+    try:
+        thread.start()
+        submit(server, {'job_id': 'hangs', 'input': source, 'operation': 'rotate', 'params': {'hang': started}})
+        deadline = time.monotonic() + 60
+        while not os.path.exists(started) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        submit(server, {'job_id': 'dies', 'input': source, 'operation': 'rotate', 'params': {'die': 1}})
+        assert wait_for('dies')['error'].startswith('BrokenProcessPool')
+        # Its pool-mate is killed with it rather than waited for
+        assert wait_for('hangs', timeout=10)['error'].startswith('BrokenProcessPool')
+
+        submit(server, {'job_id': 'next', 'input': source, 'operation': 'rotate', 'params': {'angle': 90}})
+        assert wait_for('next')['status'] == 'done'
+    finally:
+        server.stop()
+        thread.join(timeout=60)
+        signal.signal(signal.SIGTERM, previous)
+
+    assert not thread.is_alive()
+    assert {job_id: record['status'] for job_id, record in results(server).items()} == {
+        'hangs': 'failed', 'dies': 'failed', 'next': 'done'}
+    with open(server.offset_file, 'r') as f:
+        assert int(f.read()) == os.path.getsize(server.requests_file)
@@ -0,0 +1,176 @@
+import os
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from bench_suite import generate_image
+from crisiscore_processor import (ImageProcessor, PngStreamWriter, StageTimer, StripReader, TiffTileWriter,
+                                  TiledProcessor)
+
+SIZE = (300, 270)  # Several strips and a partial TIFF tile in each direction
+BUDGET = 4096
+
+def make_source(mode: str, size: tuple = SIZE) -> Image.Image:
+    if mode == 'LA':
+        return generate_image(size, 'RGBA', 'photo').convert('LA')
+    return generate_image(size, mode, 'photo')
+
+def save_source(directory, mode: str, fmt: str, size: tuple = SIZE) -> tuple:
+    img = make_source(mode, size)
+    path = os.path.join(directory, f"source_{mode}.{fmt.lower()}")
+    img.save(path, format=fmt)
+    with Image.open(path) as saved:
+        # BMP has no alpha and stores rows bottom-up; compare against what the file actually holds
+        return path, saved.convert(mode if fmt != 'BMP' else saved.mode)
+
+def run_pipeline(path: str, steps: list, tile_budget: int = BUDGET) -> tuple:
+    processor = ImageProcessor(history_file=None, tile_budget=tile_budget)
+    timer = StageTimer()
+    output = processor._execute(path, 'pipeline', {'steps': steps}, timer)
+    with Image.open(output) as result:
+        result.load()
+    return result, timer
+
+def assert_same_pixels(actual: Image.Image, expected: Image.Image):
+    assert actual.size == expected.size
+    assert actual.mode == expected.mode
+    assert ImageChops.difference(actual, expected).getbbox() is None
+
+def transposed(img: Image.Image, angle: int) -> Image.Image:
+    return img.transpose(ImageProcessor.TRANSPOSE_ROTATIONS[angle]) if angle else img
+
+@pytest.mark.parametrize('output_format', ['PNG', 'TIFF'])
+@pytest.mark.parametrize('angle', [0, 90, 180, 270])
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('input_format', ['PNG', 'TIFF'])
+def test_tiled_transpose_matches_pillow(tmp_path, input_format, mode, angle, output_format):
+    path, source = save_source(tmp_path, mode, input_format)
+    steps = ([{'operation': 'rotate', 'angle': angle}] if angle else []) + [
+        {'operation': 'convert', 'format': output_format}]
+
+    result, timer = run_pipeline(path, steps)
+
+    assert_same_pixels(result, transposed(source, angle))
+    assert timer.peak_image_bytes < source.width * source.height * len(mode)
+
+@pytest.mark.parametrize('angle', [0, 90, 180, 270])
+@pytest.mark.parametrize('mode', ['L', 'RGB'])
+def test_tiled_transpose_reads_bottom_up_bmp(tmp_path, mode, angle):
+    path, source = save_source(tmp_path, mode, 'BMP')
+    steps = ([{'operation': 'rotate', 'angle': angle}] if angle else []) + [
+        {'operation': 'convert', 'format': 'PNG'}]
+
+    result, timer = run_pipeline(path, steps)
+
+    assert_same_pixels(result, transposed(source, angle))
+    assert timer.peak_image_bytes < source.width * source.height * len(mode)
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_tiled_enhance_matches_in_memory(tmp_path, mode):
+    path, source = save_source(tmp_path, mode, 'PNG')
+    steps = [{'operation': 'enhance', 'enhancement_type': 'brightness', 'factor': 1.2},
+             {'operation': 'enhance', 'enhancement_type': 'contrast', 'factor': 0.8},
+             {'operation': 'rotate', 'angle': 90},
+             {'operation': 'convert', 'format': 'PNG'}]
+
+    tiled, _ = run_pipeline(path, steps)
+    expected, timer = run_pipeline(path, steps, tile_budget=None)
+
+    assert timer.peak_image_bytes >= source.width * source.height * len(mode)
+    assert_same_pixels(tiled, expected)
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('input_format', ['PNG', 'TIFF'])
+def test_tiled_downscale_close_to_pillow(tmp_path, input_format, mode):
+    path, source = save_source(tmp_path, mode, input_format, (640, 480))
+    steps = [{'operation': 'resize', 'width': 100, 'height': 75}, {'operation': 'convert', 'format': 'PNG'}]
+
+    result, _ = run_pipeline(path, steps)
+
+    expected = source.resize((100, 75))
+    assert result.size == expected.size
+    # Alpha is compared premultiplied: colour under fully transparent pixels carries no information
+    working = {'RGBA': 'RGBa', 'LA': 'La'}.get(mode, mode)
+    difference = ImageChops.difference(result.convert(working), expected.convert(working))
+    # Box-reducing per strip first is not bit-identical to one convolution, only within rounding
+    assert max(ImageStat.Stat(difference).mean) < 0.5
+    assert max(band.getextrema()[1] for band in difference.split()) <= 6
+
+def test_drafted_full_tier_resize_maps_the_whole_frame(tmp_path):
+    # An odd-sized JPEG drafts to a rounded-up frame; the draft box must map it back
+    path = os.path.join(tmp_path, 'source.jpg')
+    generate_image((1601, 1201), 'RGB', 'photo').save(path, quality=95)
+    with Image.open(path) as source:
+        expected = source.resize((200, 150))
+
+    result, timer = run_pipeline(path, [{'operation': 'resize', 'width': 200, 'height': 150},
+                                        {'operation': 'convert', 'format': 'PNG'}], tile_budget=1024 * 1024)
+
+    assert timer.peak_image_bytes < 1601 * 1201 * 3
+    assert max(ImageStat.Stat(ImageChops.difference(result, expected)).mean) < 1.0
+
+@pytest.mark.parametrize('from_bottom', [False, True])
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_strip_reader_streams_png(tmp_path, mode, from_bottom):
+    path = os.path.join(tmp_path, 'source.png')
+    make_source(mode).save(path)
+    with Image.open(path) as expected:
+        expected.load()
+
+    with Image.open(path) as img:
+        reader = StripReader(path, img, StageTimer())
+        assert reader.streaming
+        canvas = Image.new(mode, img.size)
+        try:
+            for y0, y1, strip in reader.windows(17, from_bottom=from_bottom):
+                assert strip.size == (img.width, y1 - y0)
+                canvas.paste(strip, (0, y0))
+            spill_path = reader._spill_path
+        finally:
+            reader.close()
+
+    assert_same_pixels(canvas, expected)
+    assert (spill_path is not None) == from_bottom
+    assert spill_path is None or not os.path.exists(spill_path)
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_png_stream_writer_round_trip(tmp_path, mode):
+    source = make_source(mode)
+    path = os.path.join(tmp_path, 'out.png')
+    writer = PngStreamWriter(path, source.size, mode)
+    for y in range(0, source.height, 16):
+        writer.write_rows(source.crop((0, y, source.width, min(source.height, y + 16))))
+    writer.close()
+
+    with Image.open(path) as result:
+        assert_same_pixels(result, source)
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_tiff_tile_writer_round_trip(tmp_path, mode):
+    source = make_source(mode)
+    path = os.path.join(tmp_path, 'out.tif')
+    tile = TiledProcessor.TILE
+    writer = TiffTileWriter(path, source.size, mode, tile)
+    # Out of order, as bottom-up reads produce them
+    for y in reversed(range(0, source.height, tile)):
+        writer.write_block(0, y, source.crop((0, y, source.width, min(source.height, y + tile))))
+    writer.close()
+
+    with Image.open(path) as result:
+        assert_same_pixels(result, source)
+
+def test_pixel_limit_is_lifted_only_when_tiling_bounds_memory(tmp_path, monkeypatch):
+    path, source = save_source(tmp_path, 'RGB', 'PNG')
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', source.width * source.height // 4)
+    resize = [{'operation': 'resize', 'width': 60, 'height': 54}]
+    strict = ImageProcessor(history_file=None, tile_budget=BUDGET)
+    large = ImageProcessor(history_file=None, tile_budget=BUDGET, allow_large_images=True)
+
+    with pytest.raises(Image.DecompressionBombError):
+        strict._execute(path, 'pipeline', {'steps': resize})
+    with Image.open(large._execute(path, 'pipeline', {'steps': resize})) as result:
+        assert result.size == (60, 54)
+    # A JPEG re-encode needs the whole frame at once
+    with pytest.raises(Image.DecompressionBombError):
+        large._execute(path, 'convert', {'format': 'JPEG'})
+    assert Image.MAX_IMAGE_PIXELS == source.width * source.height // 4